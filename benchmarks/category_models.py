@@ -0,0 +1,74 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+
+from util import Metric, TrafficColumn, WeatherColumn
+from util.cube import COUNT, rollup
+from util.models import INPUTS, fit_category_models, predict
+
+
+def synthetic_cube(rows: int, vehicles: int, hours: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    vehicle = rng.integers(0, vehicles, rows)
+    return pd.DataFrame({
+        TrafficColumn.TIMESTAMP.value: pd.Timestamp("2024-12-01") + pd.to_timedelta(rng.integers(0, hours, rows), "h"),
+        TrafficColumn.VEHICLE_NO.value: pd.Categorical((1000 + vehicle).astype(str)),
+        TrafficColumn.BRIGADE.value: pd.Categorical((vehicle % 300).astype(str)),
+        TrafficColumn.ROUTE.value: pd.Categorical((vehicle % 150).astype(str)),
+        TrafficColumn.DELAY.value: rng.normal(2, 15, rows).round().astype(np.int16),
+        COUNT: rng.integers(1, 5, rows),
+    })
+
+
+def synthetic_weather(hours: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    weather_df = pd.DataFrame(rng.normal([0, 4, 80, 0.2, 1010], [5, 2, 10, 0.5, 8], (hours, len(INPUTS))),
+                              columns=INPUTS)
+    weather_df[WeatherColumn.TIMESTAMP.value] = pd.Timestamp("2024-12-01") + pd.to_timedelta(np.arange(hours), "h")
+    return weather_df
+
+
+def _sklearn_models(cube: pd.DataFrame, weather_df: pd.DataFrame, category: str, metric: str) -> dict:
+    # The previous dashboard path, one fit per selected value, with the repeated rows as sample weights
+    stats = rollup(cube, [TrafficColumn.TIMESTAMP.value])[[TrafficColumn.TIMESTAMP.value, metric]]
+    hours = weather_df.merge(stats, left_on=WeatherColumn.TIMESTAMP.value, right_on=TrafficColumn.TIMESTAMP.value)
+    counts = cube.groupby([category, TrafficColumn.TIMESTAMP.value], observed=True)[COUNT].sum()
+    models = {}
+    for value, value_counts in counts.groupby(level=0, observed=True):
+        rows = hours.merge(value_counts.droplevel(0), left_on=TrafficColumn.TIMESTAMP.value, right_index=True)
+        models[value] = (LinearRegression().fit(rows[INPUTS], rows[metric], sample_weight=rows[COUNT]), rows)
+    return models
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched per-category regression versus one sklearn fit per value")
+    parser.add_argument("--rows", type=int, default=10 ** 6)
+    parser.add_argument("--vehicles", type=int, default=3000)
+    parser.add_argument("--hours", type=int, default=31 * 24)
+    args = parser.parse_args()
+
+    cube = synthetic_cube(args.rows, args.vehicles, args.hours)
+    weather_df = synthetic_weather(args.hours)
+    print(f"{args.rows} cube rows, {args.vehicles} vehicles, {args.hours} hours")
+
+    start = time.perf_counter()
+    models = fit_category_models(cube, weather_df)
+    print(f"{'batch, all categories and metrics':<40} {len(models):>7} models {time.perf_counter() - start:8.2f}s")
+
+    start = time.perf_counter()
+    expected = _sklearn_models(cube, weather_df, TrafficColumn.VEHICLE_NO.value, Metric.MEAN.value)
+    print(f"{'sklearn, vehicles and mean only':<40} {len(expected):>7} models {time.perf_counter() - start:8.2f}s")
+
+    worst = max(
+        np.abs(model.predict(rows[INPUTS]) -
+               predict(models.loc[(TrafficColumn.VEHICLE_NO.value, Metric.MEAN.value, value)], rows)).max()
+        for value, (model, rows) in expected.items()
+    )
+    print(f"max prediction difference {worst:.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from util import TrafficColumn, Metric, calculate_delay_stats, calculate_group_stats, calculate_traffic_metrics
+
+
+def _lambda_delay_stats(traffic: pd.DataFrame) -> pd.DataFrame:
+    return traffic.groupby(TrafficColumn.TIMESTAMP.value)[TrafficColumn.DELAY.value].agg(
+        mean="mean",
+        median="median",
+        std_dev="std",
+        q1=lambda x: np.quantile(x, 0.25),
+        q3=lambda x: np.quantile(x, 0.75),
+        count="count"
+    ).reset_index()
+
+
+def _apply_traffic_metrics(traffic: pd.DataFrame) -> pd.DataFrame:
+    def metrics(group: pd.DataFrame) -> pd.Series:
+        return pd.Series({
+            Metric.MEAN.value: group[TrafficColumn.DELAY.value].mean(),
+            Metric.MEDIAN.value: group[TrafficColumn.DELAY.value].median(),
+            Metric.STD_DEV.value: group[TrafficColumn.DELAY.value].std(),
+            Metric.Q1.value: group[TrafficColumn.DELAY.value].quantile(0.25),
+            Metric.Q3.value: group[TrafficColumn.DELAY.value].quantile(0.75),
+            Metric.COUNT.value: group[TrafficColumn.DELAY.value].count(),
+        })
+
+    return (traffic
+            .groupby(TrafficColumn.VEHICLE_NO.value, observed=True)[[TrafficColumn.DELAY.value]]
+            .apply(metrics)
+            .reset_index())
+
+
+def synthetic_traffic(rows: int, groups: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        TrafficColumn.TIMESTAMP.value: pd.Timestamp("2024-12-08") + pd.to_timedelta(
+            rng.integers(0, groups, rows), unit="h"
+        ),
+        TrafficColumn.VEHICLE_NO.value: pd.Categorical(rng.integers(1000, 1000 + groups, rows).astype(str)),
+        TrafficColumn.DELAY.value: rng.normal(2, 15, rows).round().astype(np.int16),
+    })
+
+
+def _timed(label: str, func, *args) -> pd.DataFrame:
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<45} {time.perf_counter() - start:8.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grouped delay statistics: lambda/apply vs segment engine")
+    parser.add_argument("--rows", type=int, default=10 ** 7)
+    parser.add_argument("--groups", type=int, default=10 ** 4)
+    args = parser.parse_args()
+
+    traffic = synthetic_traffic(args.rows, args.groups)
+    print(f"{args.rows} rows, {args.groups} groups")
+
+    expected = _timed("calculate_delay_stats (lambda quantiles)", _lambda_delay_stats, traffic)
+    actual = _timed("calculate_delay_stats", calculate_delay_stats, traffic)
+    assert np.allclose(expected.iloc[:, 1:].to_numpy(float), actual.iloc[:, 1:].to_numpy(float), equal_nan=True)
+
+    expected = _timed("groupby().apply(calculate_traffic_metrics)", _apply_traffic_metrics, traffic)
+    _timed("groupby().apply(calculate_traffic_metrics) new", lambda df: (
+        df.groupby(TrafficColumn.VEHICLE_NO.value, observed=True)[[TrafficColumn.DELAY.value]]
+        .apply(calculate_traffic_metrics)
+    ), traffic)
+    actual = _timed("calculate_group_stats", calculate_group_stats, traffic, [TrafficColumn.VEHICLE_NO.value])
+    assert np.allclose(expected.iloc[:, 1:].to_numpy(float), actual.iloc[:, 1:].to_numpy(float), equal_nan=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import argparse
+
+import pandas as pd
+
+from util import TRAFFIC_DTYPES, Type, memory_report
+from util.storage import TRAFFIC_CSV, read_traffic
+
+
+def _untyped_traffic(path: str) -> pd.DataFrame:
+    # What the loaders used to produce: object strings, float delays
+    return pd.read_csv(
+        path,
+        dtype={
+            column: Type.DOUBLE.value if dtype in (Type.INT16, Type.INT32) else
+            Type.BOOL.value if dtype == Type.BOOL else Type.STRING.value
+            for column, dtype in TRAFFIC_DTYPES.items() if dtype != Type.DATETIME
+        },
+        parse_dates=[column for column, dtype in TRAFFIC_DTYPES.items() if dtype == Type.DATETIME],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-column memory of the traffic frame before and after typing")
+    parser.add_argument("--path", default=TRAFFIC_CSV)
+    args = parser.parse_args()
+
+    before = _untyped_traffic(args.path)
+    after = read_traffic(columns=before.columns.tolist())
+    report = memory_report(before, after)
+    with pd.option_context("display.float_format", "{:.2f}".format):
+        print(report.assign(before=report["before"] / 1024 ** 2, after=report["after"] / 1024 ** 2)
+              .rename(columns={"before": "before MiB", "after": "after MiB"}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import write_traffic
+from util.merge_traffic import merge_traffic
+
+
+def main():
+    parser = argparse.ArgumentParser(description="merge_traffic wall time by worker count")
+    parser.add_argument("--files", type=int, default=240)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        os.chdir(root)
+        try:
+            write_traffic(".", args.files, args.rows)
+            print(f"{args.files} files x {args.rows} rows, {os.cpu_count()} CPUs")
+            baseline = None
+            for workers in args.workers:
+                start = time.perf_counter()
+                merge_traffic(workers=workers)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                print(f"{workers:>3} workers: {elapsed:7.2f}s  speedup {baseline / elapsed:4.2f}x")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
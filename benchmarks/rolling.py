@@ -0,0 +1,66 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from util import TrafficColumn, calculate_group_stats
+from util.rolling import delay_histogram, rolling_stats
+
+
+def synthetic_month(rows: int, routes: int, days: int = 30, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        TrafficColumn.TIMESTAMP.value: pd.Timestamp("2024-12-01") + pd.to_timedelta(
+            rng.integers(0, days * 24 * 3600, rows), unit="s"
+        ),
+        TrafficColumn.ROUTE.value: pd.Categorical(rng.integers(100, 100 + routes, rows).astype(str)),
+        TrafficColumn.DELAY.value: np.clip(rng.gamma(1.5, 4, rows) - 3, -60, 400).round().astype(np.int16),
+    })
+
+
+def _from_scratch(traffic: pd.DataFrame, freq: str, window: str) -> pd.DataFrame:
+    # Every window grouped again from the records it covers
+    buckets = traffic[TrafficColumn.TIMESTAMP.value].dt.floor(freq)
+    frames = []
+    for end in pd.date_range(buckets.min(), buckets.max(), freq=freq):
+        in_window = (buckets > end - pd.Timedelta(window)) & (buckets <= end)
+        stats = calculate_group_stats(traffic[in_window], [TrafficColumn.ROUTE.value])
+        stats.insert(1, TrafficColumn.TIMESTAMP.value, end)
+        frames.append(stats)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _timed(label: str, func, *args) -> pd.DataFrame:
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<45} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling delay statistics: windows regrouped vs slid over histograms")
+    parser.add_argument("--rows", type=int, default=10 ** 7)
+    parser.add_argument("--routes", type=int, default=300)
+    parser.add_argument("--freq", default="1h")
+    parser.add_argument("--window", default="7D")
+    args = parser.parse_args()
+
+    traffic = synthetic_month(args.rows, args.routes)
+    route = traffic[TrafficColumn.ROUTE.value].iloc[0]
+    line = traffic[traffic[TrafficColumn.ROUTE.value] == route]
+    print(f"{args.rows} rows, {args.routes} routes, {args.freq} buckets, {args.window} window")
+
+    by = [TrafficColumn.ROUTE.value]
+    histogram = _timed("delay_histogram (one route)", delay_histogram, line, args.freq, by)
+    actual = _timed("rolling_stats (one route)", rolling_stats, histogram, args.freq, args.window, by)
+    expected = _timed("windows from scratch (one route)", _from_scratch, line, args.freq, args.window)
+    assert len(expected) == len(actual)
+    assert np.allclose(expected.iloc[:, 2:].to_numpy(float), actual.iloc[:, 2:].to_numpy(float), equal_nan=True)
+
+    histogram = _timed("delay_histogram (all routes)", delay_histogram, traffic, args.freq, by)
+    _timed("rolling_stats (all routes)", rolling_stats, histogram, args.freq, args.window, by)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from dashboards.plots import MAX_POINTS, scatter
+
+
+def _payload(fig) -> int:
+    return len(fig.to_json())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scatter plot payload size and build time, plain px versus plots.scatter")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>9} {'plot':>18} {'payload':>12} {'time':>7}")
+    for rows in args.rows:
+        # Hourly timestamps with many delays each, like the prediction plots
+        data = pd.DataFrame({
+            "Timestamp": pd.Timestamp("2024-12-01") + pd.to_timedelta(rng.integers(0, 31 * 24, rows), unit="h"),
+            "temperatura": rng.normal(0, 5, rows).round(1),
+            "Delay": rng.exponential(3, rows).round(),
+            "count": rng.integers(1, 10, rows),
+        })
+        data["Prognoza"] = 3 + 0.01 * data["temperatura"]
+        cases = {
+            "px time series": lambda: px.scatter(data, x="Timestamp", y=["Delay", "Prognoza"], trendline="ols",
+                                                 trendline_scope="overall"),
+            "plots time series": lambda: scatter(data, x="Timestamp", y=["Delay", "Prognoza"], trendline=True,
+                                                 max_points=args.max_points),
+            "px weather": lambda: px.scatter(data, x="temperatura", y="Delay"),
+            "plots weather": lambda: scatter(data, x="temperatura", y="Delay", density=True, weight="count",
+                                             max_points=args.max_points),
+        }
+        for name, build in cases.items():
+            start = time.perf_counter()
+            size = _payload(build())
+            elapsed = time.perf_counter() - start
+            print(f"{rows:>9} {name:>18} {size / 2 ** 20:>10.2f}MB {elapsed:>6.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import traceback
+from datetime import timedelta
+from typing import Dict, Optional
+
+import numpy as np
+
+MODES = ["stores", "mapped"]
+
+
+def _memory() -> Dict[str, Optional[float]]:
+    # Proportional set size splits every shared page between the processes mapping it, so the sum over all
+    # sessions is the physical memory they really take
+    memory = {"rss_mb": None, "pss_mb": None}
+    if os.path.exists("/proc/self/smaps_rollup"):
+        with open("/proc/self/smaps_rollup") as file:
+            for line in file:
+                key, value = line.split(":", 1)
+                if key in ("Rss", "Pss"):
+                    memory[f"{key.lower()}_mb"] = int(value.split()[0]) / 1024
+    return memory
+
+
+def _session(root: str, mode: str, queries: int, seed: int, ready, done, results) -> None:
+    try:
+        results.put(_queries(root, mode, queries, seed))
+    except Exception:
+        results.put({"error": traceback.format_exc()})
+        return
+    ready.wait()
+    # Kept alive until every session has reported, so all of them hold their data at the same time
+    done.wait()
+
+
+def _queries(root: str, mode: str, queries: int, seed: int) -> dict:
+    # One analyst's dashboard process: loads the frames every page starts from, then answers random selections
+    os.chdir(root)
+    from util import TrafficColumn, calculate_group_stats, in_date_range, load_traffic_data, storage
+    from util.cache import cube_data, raw_traffic_data, traffic_date_range, weather_data
+    from util.cube import rollup
+
+    storage.MAPPED = mode == "mapped"
+    rng = np.random.default_rng(seed)
+    before = _memory()
+    start = time.perf_counter()
+    cube_data()
+    weather_data()
+    raw_traffic_data()
+    load_seconds = time.perf_counter() - start
+
+    first_day, last_day = traffic_date_range()
+    days = (last_day - first_day).days + 1
+    groups = [TrafficColumn.VEHICLE_NO.value, TrafficColumn.BRIGADE.value, TrafficColumn.ROUTE.value]
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        day = first_day + timedelta(days=int(rng.integers(0, days)))
+        cube = cube_data()
+        rollup(cube[in_date_range(cube[TrafficColumn.TIMESTAMP.value], day, day)], [str(rng.choice(groups))])
+        calculate_group_stats(load_traffic_data(day, day), [TrafficColumn.ROUTE.value])
+        latencies.append(time.perf_counter() - start)
+    after = _memory()
+    data_pss = after["pss_mb"] - before["pss_mb"] if after["pss_mb"] is not None else None
+    return {"load_seconds": load_seconds, "latencies": latencies, "data_pss_mb": data_pss, **after}
+
+
+def _run(root: str, mode: str, users: int, queries: int) -> dict:
+    context = multiprocessing.get_context("spawn")
+    ready, done = context.Barrier(users + 1), context.Event()
+    results = context.Queue()
+    sessions = [
+        context.Process(target=_session, args=(root, mode, queries, seed, ready, done, results))
+        for seed in range(users)
+    ]
+    for session in sessions:
+        session.start()
+    reports = [results.get() for _ in sessions]
+    errors = [report["error"] for report in reports if "error" in report]
+    if errors:
+        for session in sessions:
+            session.terminate()
+        raise RuntimeError(f"{len(errors)} sessions failed:\n{errors[0]}")
+    ready.wait()
+    done.set()
+    for session in sessions:
+        session.join()
+
+    latencies = np.concatenate([report["latencies"] for report in reports])
+    loads = np.array([report["load_seconds"] for report in reports])
+    pss = [report["pss_mb"] for report in reports]
+    data_pss = [report["data_pss_mb"] for report in reports]
+    return {
+        "mode": mode,
+        "users": users,
+        "total_pss_mb": sum(pss) if None not in pss else None,
+        "data_pss_mb": sum(data_pss) if None not in data_pss else None,
+        "rss_mb": float(np.mean([report["rss_mb"] or 0 for report in reports])),
+        "load_p50": float(np.median(loads)),
+        "query_p50": float(np.median(latencies)),
+        "query_p95": float(np.percentile(latencies, 95)),
+    }
+
+
+def _prepare(root: str, days: int, rows_per_hour: int) -> None:
+    from benchmarks.synthetic import generate
+    from util.cube import write_cube
+    from util.merge_traffic import START_DATE, merge_traffic
+    from util.merge_weather import merge_weather
+    from util.storage import write_traffic_store, write_weather_store
+
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        generate(".", days, rows_per_hour)
+        merge_traffic(end_date=START_DATE + timedelta(days=days) - timedelta(hours=1))
+        merge_weather()
+        write_traffic_store()
+        write_weather_store()
+        write_cube()
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent dashboard sessions reading the stores or the mapped files")
+    parser.add_argument("--root", help="prepared data directory, synthetic data in a temporary one by default")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--rows-per-hour", type=int, default=20_000)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=10, help="random selections per session")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary:
+        root = os.path.abspath(args.root or temporary)
+        if not args.root:
+            _prepare(root, args.days, args.rows_per_hour)
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            from util.serving import write_serving_files
+            write_serving_files()
+        finally:
+            os.chdir(cwd)
+
+        # Data PSS leaves out the interpreter and libraries, what is left is what the sessions' frames take
+        print(f"{'mode':<8} {'users':>5} {'total PSS':>10} {'data PSS':>10} {'RSS/user':>9} {'load p50':>9} "
+              f"{'query p50':>10} {'query p95':>10}")
+        for users in args.users:
+            for mode in MODES:
+                result = _run(root, mode, users, args.queries)
+                pss = [
+                    f"{result[key]:8.0f}MB" if result[key] is not None else f"{'n/a':>10}"
+                    for key in ("total_pss_mb", "data_pss_mb")
+                ]
+                print(f"{mode:<8} {users:>5} {' '.join(pss)} {result['rss_mb']:7.0f}MB {result['load_p50']:8.2f}s "
+                      f"{result['query_p50'] * 1000:8.0f}ms {result['query_p95'] * 1000:8.0f}ms", flush=True)
+
+
+if __name__ == '__main__':
+    main()
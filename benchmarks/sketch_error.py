@@ -0,0 +1,59 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.grouped_stats import synthetic_traffic
+from util import TrafficColumn, Metric
+from util.sketch import build_sketch, merge_sketches, sketch_rollup
+
+QUANTILES = {Metric.MEDIAN.value: 0.5, Metric.Q1.value: 0.25, Metric.Q3.value: 0.75}
+
+
+def _exact_quantiles(traffic: pd.DataFrame) -> pd.DataFrame:
+    grouped = traffic.groupby(TrafficColumn.ROUTE.value, observed=True)[TrafficColumn.DELAY.value]
+    return pd.DataFrame({
+        metric: grouped.agg(lambda x, q=q: np.quantile(x, q))
+        for metric, q in QUANTILES.items()
+    }).reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantile sketch error versus exact np.quantile")
+    parser.add_argument("--rows", type=int, default=10 ** 6)
+    parser.add_argument("--groups", type=int, default=10 ** 3)
+    parser.add_argument("--chunks", type=int, default=10)
+    parser.add_argument("--alpha", type=float, nargs="+", default=[0.001, 0.01, 0.05])
+    args = parser.parse_args()
+
+    traffic = synthetic_traffic(args.rows, args.groups)
+    # Heavy right tail, like the multi-hour delays seen in the real data
+    tail = np.random.default_rng(1).random(len(traffic)) < 0.01
+    traffic.loc[tail, TrafficColumn.DELAY.value] *= 20
+    # The sketch keeps routes but not vehicles, so the synthetic groups become routes
+    traffic[TrafficColumn.ROUTE.value] = traffic.pop(TrafficColumn.VEHICLE_NO.value)
+    traffic[TrafficColumn.TYPE.value] = "-"
+    traffic[TrafficColumn.OUTSIDE.value] = False
+    exact = _exact_quantiles(traffic)
+
+    print(f"{args.rows} rows, {args.groups} routes, sketches merged from {args.chunks} chunks")
+    print(f"{'alpha':>7} {'rows':>9} {'build':>7}  " + "  ".join(f"{m + ' max err':>22}" for m in QUANTILES))
+    for alpha in args.alpha:
+        start = time.perf_counter()
+        bounds = np.linspace(0, len(traffic), args.chunks + 1).astype(int)
+        sketch_df = merge_sketches([
+            build_sketch(traffic.iloc[lower:upper], alpha) for lower, upper in zip(bounds[:-1], bounds[1:])
+        ])
+        elapsed = time.perf_counter() - start
+        approximate = sketch_rollup(sketch_df, [TrafficColumn.ROUTE.value])
+        errors = []
+        for metric in QUANTILES:
+            absolute = (approximate[metric] - exact[metric]).abs()
+            relative = absolute / exact[metric].abs().where(exact[metric] != 0)
+            errors.append(f"{absolute.max():8.3f} min ({relative.max():6.2%})")
+        print(f"{alpha:>7} {len(sketch_df):>9} {elapsed:>6.2f}s  " + "  ".join(f"{e:>22}" for e in errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import STATIONS, generate
+from util import TrafficColumn, calculate_delay_stats, iter_traffic_data, load_traffic_data
+from util.cache import clear_cache
+from util.cube import chunked_delay_stats, load_cube, rollup, write_cube
+from util.features import write_features
+from util.merge_traffic import START_DATE, merge_traffic
+from util.merge_weather import merge_weather
+from util.models import write_models
+from util.precompute import write_precomputed
+from util.sketch import DEFAULT_ALPHA
+from util.stops import write_stop_delays
+from util.storage import write_traffic_store, write_weather_store
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARDS = ["traffic_overview", "day_types", "traffic_categories", "predictions"]
+
+
+def _timed(results: List[dict], group: str, name: str, func: Callable[[], object]) -> object:
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    results.append({"group": group, "name": name, "seconds": round(seconds, 4)})
+    print(f"{group:<10} {name:<35} {seconds:8.2f}s")
+    return result
+
+
+def _pipeline(results: List[dict], days: int, workers: int) -> None:
+    # Same steps and order as setup.py, without the download
+    end_date = START_DATE + timedelta(days=days) - timedelta(hours=1)
+    _timed(results, "pipeline", "merge_traffic", lambda: merge_traffic(
+        sketch_alpha=DEFAULT_ALPHA, end_date=end_date, workers=workers
+    ))
+    _timed(results, "pipeline", "merge_weather", merge_weather)
+    _timed(results, "pipeline", "write_traffic_store", write_traffic_store)
+    _timed(results, "pipeline", "write_weather_store", write_weather_store)
+    _timed(results, "pipeline", "write_cube", write_cube)
+    _timed(results, "pipeline", "write_features", write_features)
+    _timed(results, "pipeline", "write_models", write_models)
+    _timed(results, "pipeline", "write_stop_delays", write_stop_delays)
+    _timed(results, "pipeline", "write_precomputed", write_precomputed)
+
+
+def _analyses(results: List[dict]) -> None:
+    traffic = _timed(results, "analysis", "load_traffic_data", load_traffic_data)
+    traffic[TrafficColumn.TIMESTAMP.value] = traffic[TrafficColumn.TIMESTAMP.value].dt.floor("h")
+    _timed(results, "analysis", "calculate_delay_stats", lambda: calculate_delay_stats(traffic))
+
+    def hourly_chunks():
+        for chunk in iter_traffic_data():
+            yield chunk.assign(**{TrafficColumn.TIMESTAMP.value: chunk[TrafficColumn.TIMESTAMP.value].dt.floor("h")})
+
+    _timed(results, "analysis", "chunked_delay_stats", lambda: chunked_delay_stats(hourly_chunks()))
+    cube = _timed(results, "analysis", "load_cube", load_cube)
+    _timed(results, "analysis", "rollup by day type", lambda: rollup(cube, [TrafficColumn.DAY_TYPE.value]))
+
+
+def _dashboards(results: List[dict], names: List[str]) -> Dict[str, List[str]]:
+    from streamlit.testing.v1 import AppTest
+
+    exceptions = {}
+    for name in names:
+        # Cold run builds every cached frame the page needs, the rerun is what a widget change costs
+        clear_cache()
+        app = AppTest.from_file(os.path.join(REPO_ROOT, "dashboards", f"{name}.py"), default_timeout=600)
+        _timed(results, "dashboard", f"{name} cold", app.run)
+        _timed(results, "dashboard", f"{name} rerun", app.run)
+        exceptions[name] = [str(e.value) for e in app.exception]
+    return exceptions
+
+
+def _compare(results: List[dict], baseline_path: str) -> None:
+    with open(baseline_path) as file:
+        baseline = {(r["group"], r["name"]): r["seconds"] for r in json.load(file)["results"]}
+    print(f"\n{'stage':<46} {'baseline':>9} {'now':>9} {'ratio':>6}")
+    for result in results:
+        before = baseline.get((result["group"], result["name"]))
+        if before:
+            print(f"{result['group'] + ' ' + result['name']:<46} {before:8.2f}s {result['seconds']:8.2f}s "
+                  f"{result['seconds'] / before:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times every pipeline stage and dashboard on synthetic data")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--rows-per-hour", type=int, default=5000)
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=300)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    parser.add_argument("--early", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stations", type=int, default=len(STATIONS))
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--dashboards", nargs="*", default=DASHBOARDS, help="pass none to skip the dashboards")
+    parser.add_argument("--root", help="data directory to use, a temporary one by default")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temporary:
+        root = os.path.abspath(args.root or temporary)
+        os.makedirs(root, exist_ok=True)
+        os.chdir(root)
+        try:
+            _timed(results, "generate", "synthetic data", lambda: generate(
+                ".", args.days, args.rows_per_hour, args.vehicles, args.lines, duplicates=args.duplicates,
+                early=args.early, seed=args.seed, stations=args.stations
+            ))
+            _pipeline(results, args.days, args.workers)
+            _analyses(results)
+            exceptions = _dashboards(results, args.dashboards)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "root")},
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+        "dashboard_exceptions": exceptions,
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=1)
+    print(f"\nResults written to {output}")
+    if baseline:
+        _compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
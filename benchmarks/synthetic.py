@@ -0,0 +1,175 @@
+import argparse
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from util.merge_traffic import START_DATE
+from util.stops import STOPS_PATH
+
+TRAFFIC_DIR = "data/traffic"
+WEATHER_DIR = "data/weather"
+TYPES = {"Autobus": 0.7, "Tramwaj": 0.25, "Pociąg": 0.05}
+# Synop stations, every hourly file carries a measurement of each like the IMGW ones do
+STATIONS = [(12375, "Warszawa"), (12330, "Poznań"), (12424, "Wrocław"), (12560, "Katowice"), (12566, "Kraków")]
+# Warsaw city centre, stops are spread around it
+CENTRE = (52.23, 21.01)
+
+
+def _fleet(vehicles: int, lines: int, rng: np.random.Generator) -> pd.DataFrame:
+    # Every vehicle serves one line and brigade, lines are named like ZTM ones
+    types = rng.choice(list(TYPES), vehicles, p=list(TYPES.values()))
+    line = rng.integers(0, lines, vehicles)
+    route = np.select(
+        [types == "Tramwaj", types == "Pociąg"],
+        [(line % 79 + 1).astype(str), np.char.add("S", (line % 4 + 1).astype(str))],
+        np.where(line % 10 == 0, np.char.add("N", (line % 90 + 10).astype(str)), (line % 800 + 100).astype(str))
+    )
+    number = rng.integers(1, 40, vehicles).astype(str)
+    kind = rng.random(vehicles)
+    # Marathon brigades, and numeric brigades some files carry as floats
+    brigade = np.where(kind < 0.1, np.char.add("M", number), np.where(kind < 0.2, np.char.add(number, ".0"), number))
+    return pd.DataFrame({
+        "Type": types,
+        "Route": route,
+        "Brigade": brigade,
+        "Vehicle No": rng.choice(np.arange(1000, 1000 + max(9000, vehicles)), vehicles, replace=False),
+    })
+
+
+def stop_names(stops: int) -> np.ndarray:
+    return np.array([f"Przystanek {i:04d}" for i in range(stops)])
+
+
+def write_stops(root: str, stops: int, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    # One to three platforms per stop name, close to each other
+    platforms = rng.integers(1, 4, stops)
+    names = np.repeat(stop_names(stops), platforms)
+    lat = np.repeat(rng.normal(CENTRE[0], 0.05, stops), platforms) + rng.normal(0, 0.0005, len(names))
+    lon = np.repeat(rng.normal(CENTRE[1], 0.08, stops), platforms) + rng.normal(0, 0.0005, len(names))
+    path = os.path.join(root, STOPS_PATH)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame({
+        "stop_id": np.arange(len(names)),
+        "stop_name": names,
+        "stop_lat": lat.round(6),
+        "stop_lon": lon.round(6),
+    }).to_csv(path, index=False)
+
+
+def write_traffic(
+        root: str,
+        hours: int,
+        rows_per_hour: int,
+        vehicles: int = 2000,
+        lines: int = 300,
+        stops: int = 500,
+        duplicates: float = 0.1,
+        early: float = 0.3,
+        start: datetime = START_DATE,
+        seed: int = 0
+) -> None:
+    rng = np.random.default_rng(seed)
+    fleet = _fleet(vehicles, lines, rng)
+    names = stop_names(stops)
+    previous = None
+    for hour in range(hours):
+        hour_start = start + timedelta(hours=hour)
+        # Fewer vehicles at night, the evening and morning peaks carry the most records
+        rows = max(1, int(rows_per_hour * (0.3 + 0.7 * np.sin(np.pi * (hour_start.hour - 4) / 20) ** 2)))
+        vehicle = fleet.iloc[rng.integers(0, vehicles, rows)].reset_index(drop=True)
+        minutes = np.abs(rng.normal(2, 5, rows)).astype(int) + 1
+        is_early = rng.random(rows) < early
+        frame = vehicle.assign(**{
+            "Timestamp": (hour_start + pd.to_timedelta(rng.integers(0, 3600, rows), unit="s"))
+            .strftime("%Y-%m-%d %H:%M:%S"),
+            "Stop Name": rng.choice(names, rows),
+            "Delay": np.where(is_early, np.char.add(minutes.astype(str), " min przed czasem"),
+                              np.char.add(minutes.astype(str), " min")),
+            "Outside": np.where(rng.random(rows) < 0.03, "Poza trasą", ""),
+        })
+        if previous is not None and duplicates > 0:
+            # Each scrape overlaps the previous one, those records show up in both files
+            repeated = previous.sample(frac=min(duplicates, 1.0), random_state=rng.integers(2 ** 31))
+            frame = pd.concat([frame, repeated], ignore_index=True)
+        previous = frame
+        path = os.path.join(root, TRAFFIC_DIR, hour_start.strftime("%Y/%m/%d/delays-%H.csv"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame[["Timestamp", "Stop Name", "Type", "Route", "Brigade", "Vehicle No", "Delay", "Outside"]].to_csv(
+            path, index=False
+        )
+
+
+def write_weather(
+        root: str,
+        hours: int,
+        start: datetime = START_DATE,
+        seed: int = 0,
+        stations: int = len(STATIONS)
+) -> None:
+    rng = np.random.default_rng(seed)
+    ids, names = zip(*STATIONS[:stations])
+    # Each station is a little warmer or colder and windier than the others
+    offset = rng.normal(0, 1.5, stations)
+    wind = rng.uniform(1, 3, stations)
+    for hour in range(hours):
+        hour_start = start + timedelta(hours=hour)
+        path = os.path.join(root, WEATHER_DIR, hour_start.strftime("%Y/%m/%d/weather-%H.csv"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rain = rng.random(stations) < 0.2
+        pd.DataFrame({
+            "id_stacji": ids,
+            "stacja": names,
+            "data_pomiaru": hour_start.strftime("%Y-%m-%d"),
+            "godzina_pomiaru": hour_start.hour,
+            "temperatura": (2 + offset + 4 * np.sin(np.pi * (hour_start.hour - 9) / 12)
+                            + rng.normal(0, 2, stations)).round(1),
+            "predkosc_wiatru": rng.gamma(2, wind).astype(int),
+            "kierunek_wiatru": rng.integers(0, 360, stations),
+            "wilgotnosc_wzgledna": np.clip(rng.normal(85, 8, stations), 30, 100).round(1),
+            "suma_opadu": np.where(rain, rng.exponential(2, stations), 0.0).round(1),
+            "cisnienie": rng.normal(1012, 8, stations).round(1),
+        }).to_csv(path, index=False)
+
+
+def generate(
+        root: str,
+        days: int,
+        rows_per_hour: int,
+        vehicles: int = 2000,
+        lines: int = 300,
+        stops: int = 500,
+        duplicates: float = 0.1,
+        early: float = 0.3,
+        start: datetime = START_DATE,
+        seed: int = 0,
+        stations: int = len(STATIONS)
+) -> None:
+    write_traffic(root, days * 24, rows_per_hour, vehicles, lines, stops, duplicates, early, start, seed)
+    write_weather(root, days * 24, start, seed, stations)
+    write_stops(root, stops, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic traffic, weather and GTFS stops in the downloaded layout")
+    parser.add_argument("root", help="directory the data/ tree is written to")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--rows-per-hour", type=int, default=20_000)
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=300)
+    parser.add_argument("--stops", type=int, default=500)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="share of each file repeated in the next one")
+    parser.add_argument("--early", type=float, default=0.3, help="share of 'przed czasem' records")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=START_DATE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stations", type=int, default=len(STATIONS), choices=range(1, len(STATIONS) + 1),
+                        metavar=f"1-{len(STATIONS)}", help="weather stations in every hourly file")
+    args = parser.parse_args()
+    generate(args.root, args.days, args.rows_per_hour, args.vehicles, args.lines, args.stops, args.duplicates,
+             args.early, args.start, args.seed, args.stations)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,17 @@
-import pandas as pd
 import plotly.express as px
 import streamlit as st
-from holidays.countries import Poland
 
-from util import load_traffic_data, load_weather_data, TrafficColumn, WeatherColumn, calculate_delay_stats, DayType, \
-    Metric
+from dashboards.widgets import approximate_quantiles, date_range, debug_panel
+from util import TrafficColumn, WeatherColumn, Metric, instrument
+from util.cache import sketch_data, traffic_date_range
+from util.precompute import WEATHER_METRICS, WEATHER_PARAMS, dataset
+from util.sketch import sketch_rollup
 
-traffic_df = load_traffic_data()
-weather_df = load_weather_data()
-
-traffic_df[TrafficColumn.TIMESTAMP.value] = pd.to_datetime(traffic_df[TrafficColumn.TIMESTAMP.value]).dt.floor("h")
-weather_df[WeatherColumn.TIMESTAMP.value] = pd.to_datetime(weather_df[WeatherColumn.TIMESTAMP.value])
+instrument.start_run()
+first_day, last_day = date_range(*traffic_date_range())
 
 # ============================== CORRELATION MATRIX ==============================
-merged_df = pd.merge(
-    weather_df, traffic_df,
-    left_on=WeatherColumn.TIMESTAMP.value,
-    right_on=TrafficColumn.TIMESTAMP.value,
-    how="left",
-    validate="1:m"
-)
-delay_stats_df = calculate_delay_stats(traffic_df)
-correlation_df = pd.merge(
-    weather_df, delay_stats_df,
-    left_on=WeatherColumn.TIMESTAMP.value,
-    right_on=TrafficColumn.TIMESTAMP.value,
-    how="left",
-    validate="1:m"
-)
-correlation_matrix = correlation_df.corr()
+correlation_matrix = dataset("weather_correlation", first_day, last_day)
 correlation_fig = px.imshow(
     correlation_matrix,
     text_auto=True,
@@ -48,59 +31,17 @@ st.write(
 # ================================================================================
 
 # ============================== WEATHER STATS =====================================
-start_date = min(
-    traffic_df[TrafficColumn.TIMESTAMP.value].min(),
-    weather_df[WeatherColumn.TIMESTAMP.value].min()
-)
-end_date = max(
-    traffic_df[TrafficColumn.TIMESTAMP.value].max(),
-    weather_df[WeatherColumn.TIMESTAMP.value].max()
-)
-
-pl_holidays = [
-    pd.Timestamp(date) for date in
-    Poland(years=range(start_date.year, end_date.year + 1))
-]
-
-
-def get_day_type(date):
-    date = pd.Timestamp(date)
-    if date in pl_holidays:
-        return DayType.HOLIDAY.value
-    elif date.weekday() >= 5:
-        return DayType.WEEKEND.value
-    else:
-        return DayType.WEEKDAY.value
-
-
-traffic_df[TrafficColumn.DAY_TYPE.value] = traffic_df[TrafficColumn.TIMESTAMP.value].dt.date.apply(get_day_type)
-weather_df[WeatherColumn.DAY_TYPE.value] = weather_df[WeatherColumn.TIMESTAMP.value].dt.date.apply(get_day_type)
-
-weather_holiday_analysis = {
-    Metric.MEAN.value: weather_df.groupby(WeatherColumn.DAY_TYPE.value).mean().reset_index(),
-    Metric.MEDIAN.value: weather_df.groupby(WeatherColumn.DAY_TYPE.value).median().reset_index(),
-    Metric.STD_DEV.value: weather_df.groupby(WeatherColumn.DAY_TYPE.value).std().reset_index(),
-    Metric.Q1.value: weather_df.groupby(WeatherColumn.DAY_TYPE.value).quantile(0.25).reset_index(),
-    Metric.Q3.value: weather_df.groupby(WeatherColumn.DAY_TYPE.value).quantile(0.75).reset_index(),
-}
-
 selected_weather_metric = st.selectbox(
     "Metryka",
-    [e.value for e in Metric if e != Metric.COUNT]
+    list(WEATHER_METRICS)
 )
 selected_weather_param = st.selectbox(
     "Parametr pogody",
-    [
-        WeatherColumn.TEMPERATURE.value,
-        WeatherColumn.WIND_SPEED.value,
-        WeatherColumn.HUMIDITY.value,
-        WeatherColumn.RAINFALL.value,
-        WeatherColumn.PRESSURE.value,
-    ]
+    WEATHER_PARAMS
 )
 
 avg_weather_params_fig = px.bar(
-    weather_holiday_analysis[selected_weather_metric][[
+    dataset("weather_by_day_type", first_day, last_day, selected_weather_metric)[[
         WeatherColumn.DAY_TYPE.value,
         selected_weather_param
     ]],
@@ -125,18 +66,15 @@ st.write(
 # ================================================================================
 
 # ============================== GLOBAL DELAY STATS ==============================
+if approximate_quantiles():
+    day_type_stats_df = sketch_rollup(sketch_data(), [TrafficColumn.DAY_TYPE.value], first_day, last_day)
+else:
+    day_type_stats_df = dataset("day_type_delays", first_day, last_day)
 delay_stats = {
-    Metric.MEAN.value: traffic_df.groupby(TrafficColumn.DAY_TYPE.value)[TrafficColumn.DELAY.value].mean().reset_index(),
-    Metric.MEDIAN.value: traffic_df.groupby(TrafficColumn.DAY_TYPE.value)[
-        TrafficColumn.DELAY.value].median().reset_index(),
-    Metric.STD_DEV.value: traffic_df.groupby(TrafficColumn.DAY_TYPE.value)[
-        TrafficColumn.DELAY.value].std().reset_index(),
-    Metric.Q1.value: traffic_df.groupby(TrafficColumn.DAY_TYPE.value)[TrafficColumn.DELAY.value].quantile(
-        0.25).reset_index(),
-    Metric.Q3.value: traffic_df.groupby(TrafficColumn.DAY_TYPE.value)[TrafficColumn.DELAY.value].quantile(
-        0.75).reset_index(),
-    Metric.COUNT.value: traffic_df.groupby(TrafficColumn.DAY_TYPE.value)[
-        TrafficColumn.DELAY.value].count().reset_index(),
+    e.value: day_type_stats_df[[TrafficColumn.DAY_TYPE.value, e.value]].rename(
+        columns={e.value: TrafficColumn.DELAY.value}
+    )
+    for e in Metric
 }
 
 selected_delay_stat = st.selectbox(
@@ -178,3 +116,5 @@ st.write(
     """
 )
 # ================================================================================
+
+debug_panel()
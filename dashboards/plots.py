@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+MAX_POINTS = 20_000
+DENSITY_BINS = 100
+
+
+def _numeric(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return values.to_numpy(np.float64)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets, indices of the kept points in x order
+    n = len(x)
+    order = np.argsort(x, kind="stable")
+    if n_out >= n or n_out < 3:
+        return order
+    xs, ys = x[order], y[order]
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lower, upper = edges[i], edges[i + 1]
+        next_upper = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = xs[upper:next_upper].mean(), ys[upper:next_upper].mean()
+        area = np.abs((xs[a] - avg_x) * (ys[lower:upper] - ys[a]) - (xs[a] - xs[lower:upper]) * (avg_y - ys[a]))
+        a = lower + int(np.argmax(area))
+        kept[i + 1] = a
+    return order[kept]
+
+
+def _downsample(data: pd.DataFrame, x: str, series: List[str], max_points: int) -> pd.DataFrame:
+    x_values = _numeric(data[x])
+    kept = []
+    for column in series:
+        valid = np.flatnonzero(data[column].notna().to_numpy() & ~np.isnan(x_values))
+        y_values = _numeric(data[column])[valid]
+        kept.append(valid[lttb(x_values[valid], y_values, max_points // len(series))])
+    return data.iloc[np.unique(np.concatenate(kept))]
+
+
+def _trendline(data: pd.DataFrame, x: str, series: List[str]) -> go.Scattergl:
+    # Ordinary least squares over all series together, like px with trendline_scope="overall"
+    x_values = np.tile(_numeric(data[x]), len(series))
+    y_values = np.concatenate([_numeric(data[column]) for column in series])
+    valid = ~np.isnan(x_values) & ~np.isnan(y_values)
+    slope, intercept = np.polyfit(x_values[valid], y_values[valid], 1)
+    ends = data[x].agg(["min", "max"])
+    return go.Scattergl(
+        x=ends.to_numpy(),
+        y=slope * _numeric(ends) + intercept,
+        mode="lines",
+        name="Overall Trendline",
+        showlegend=True
+    )
+
+
+def _density(
+        data: pd.DataFrame,
+        x: str,
+        y: str,
+        weight: Optional[str],
+        labels: Dict[str, str],
+        title: Optional[str]
+) -> go.Figure:
+    # Binned here, px.density_heatmap would still ship every point and bin them in the browser
+    valid = data[x].notna() & data[y].notna()
+    counts, x_edges, y_edges = np.histogram2d(
+        data.loc[valid, x], data.loc[valid, y], bins=DENSITY_BINS,
+        weights=data.loc[valid, weight] if weight else None
+    )
+    fig = go.Figure(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=np.where(counts > 0, counts, np.nan).T,
+        colorbar=dict(title=labels.get(weight, "count"))
+    ))
+    fig.update_layout(title=title, xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y))
+    return fig
+
+
+def scatter(
+        data: pd.DataFrame,
+        x: str,
+        y: Union[str, List[str]],
+        trendline: bool = False,
+        density: bool = False,
+        weight: Optional[str] = None,
+        max_points: int = MAX_POINTS,
+        **kwargs
+) -> go.Figure:
+    # Payload stays bounded by max_points: repeated points are sent once, the rest is downsampled,
+    # or binned into a heatmap weighted by the weight column when density is set
+    series = [y] if isinstance(y, str) else list(y)
+    if len(data) <= max_points:
+        trend = dict(trendline="ols", trendline_scope="overall") if trendline else {}
+        return px.scatter(data, x=x, y=y, render_mode="webgl", **trend, **kwargs)
+
+    if density:
+        return _density(data, x, series[0], weight, kwargs.get("labels", {}), kwargs.get("title"))
+
+    points = data.drop_duplicates([x, *series])
+    if len(points) > max_points:
+        points = _downsample(points, x, series, max_points)
+    fig = px.scatter(points, x=x, y=y, render_mode="webgl", **kwargs)
+    if trendline:
+        fig.add_trace(_trendline(data, x, series))
+    return fig
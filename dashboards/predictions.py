@@ -1,67 +1,38 @@
 import pandas as pd
-import plotly.express as px
 import streamlit as st
-from sklearn.linear_model import LinearRegression
 
-from util import load_traffic_data, load_weather_data, WeatherColumn, TrafficColumn, Metric, calculate_delay_stats
-
-traffic_df = load_traffic_data()
-traffic_df[TrafficColumn.TIMESTAMP.value] = pd.to_datetime(traffic_df[TrafficColumn.TIMESTAMP.value]).dt.floor("h")
-weather_df = load_weather_data()
-weather_df[WeatherColumn.TIMESTAMP.value] = pd.to_datetime(weather_df[WeatherColumn.TIMESTAMP.value])
-
-merged_df = pd.merge(
-    weather_df, traffic_df,
-    left_on=WeatherColumn.TIMESTAMP.value,
-    right_on=TrafficColumn.TIMESTAMP.value,
-    how="left",
-    validate="1:m"
-)
+from dashboards.plots import scatter
+from dashboards.widgets import date_range, debug_panel
+from util import WeatherColumn, TrafficColumn, Metric, in_date_range, instrument
+from util.cache import traffic_date_range, weather_data
+from util.cube import COUNT
+from util.models import CATEGORIES, CATEGORY_MODELS, TARGETS, predict
+from util.precompute import dataset, models_between
+
+instrument.start_run()
+first_day, last_day = date_range(*traffic_date_range())
+weather_df = weather_data()
+weather_df = weather_df[in_date_range(weather_df[WeatherColumn.TIMESTAMP.value], first_day, last_day)]
+# Weather measurements with the delay statistics of their hour, only hours that had traffic
+weather_stats = dataset("hourly_delay_stats", first_day, last_day)
+delay_stats = weather_stats.drop_duplicates(TrafficColumn.TIMESTAMP.value)[
+    [TrafficColumn.TIMESTAMP.value] + [e.value for e in Metric]
+]
 
 st.header("Ogólna prognoza")
 global_metric = st.selectbox(
     "Metryka",
-    [Metric.MEAN.value, Metric.COUNT.value],
+    TARGETS,
     key="global_metric",
 )
 
-global_delay_stats = calculate_delay_stats(traffic_df)
-global_merged_df = pd.merge(
-    weather_df,
-    global_delay_stats[[TrafficColumn.TIMESTAMP.value, global_metric]],
-    left_on=WeatherColumn.TIMESTAMP.value,
-    right_on=TrafficColumn.TIMESTAMP.value,
-    how="inner",
-    validate="m:1"
-)
-
-X_global = global_merged_df[[
-    WeatherColumn.TEMPERATURE.value,
-    WeatherColumn.WIND_SPEED.value,
-    WeatherColumn.HUMIDITY.value,
-    WeatherColumn.RAINFALL.value,
-    WeatherColumn.PRESSURE.value
-]]
-y_global = global_merged_df[global_metric]
-
-global_model = LinearRegression()
-global_model.fit(X_global, y_global)
+global_plot_df = dataset("global_predictions", first_day, last_day, global_metric)
 
-global_predictions = global_model.predict(X_global)
-global_prediction_dates = global_merged_df[WeatherColumn.TIMESTAMP.value]
-
-global_plot_df = pd.DataFrame({
-    "Timestamp": global_prediction_dates,
-    "Stan faktyczny": y_global,
-    "Prognoza": global_predictions
-})
-
-global_fig = px.scatter(
+global_fig = scatter(
     global_plot_df,
     x="Timestamp",
     y=["Stan faktyczny", "Prognoza"],
-    trendline="ols",
-    trendline_scope="overall",
+    trendline=True,
     labels={"value": "Opóźnienie"},
 )
 global_fig.update_traces(marker=dict(size=3))
@@ -77,30 +48,37 @@ st.plotly_chart(global_fig)
 st.header("Szczegółowa prognoza")
 selected_category = st.selectbox(
     "Kategoria",
-    [
-        TrafficColumn.VEHICLE_NO.value,
-        TrafficColumn.BRIGADE.value,
-        TrafficColumn.ROUTE.value,
-    ],
+    CATEGORIES,
     key="specific_category",
 )
 selected_metric = st.selectbox(
     "Metryka",
-    [Metric.MEAN.value, Metric.COUNT.value],
+    TARGETS,
     key="specific_metric",
 )
-unique_values = merged_df[selected_category].dropna().unique()
-unique_values.sort()
+models = models_between(CATEGORY_MODELS, first_day, last_day)
+unique_values = sorted(models.loc[(selected_category, selected_metric)].index)
 selected_value = st.selectbox(
     selected_category,
     unique_values,
     key="specific_value",
 )
+model = models.loc[(selected_category, selected_metric, selected_value)]
+
+# One row per station's measurement and matching delay record, like joining the weather with raw traffic rows
+category_hours = dataset("category_hours", first_day, last_day, selected_category)
+value_counts = category_hours[category_hours[selected_category] == selected_value].set_index(
+    TrafficColumn.TIMESTAMP.value
+)[COUNT]
+filtered_df = pd.merge(
+    weather_df, value_counts,
+    left_on=WeatherColumn.TIMESTAMP.value,
+    right_index=True,
+    how="inner",
+    validate="m:1"
+)
+filtered_df = filtered_df.loc[filtered_df.index.repeat(filtered_df[COUNT])]
 
-filtered_df = merged_df[merged_df[selected_category] == selected_value]
-
-delay_stats = calculate_delay_stats(traffic_df)
-delay_stats = delay_stats[delay_stats[TrafficColumn.TIMESTAMP.value].isin(filtered_df[WeatherColumn.TIMESTAMP.value])]
 merged_filtered_df = pd.merge(
     filtered_df,
     delay_stats[[TrafficColumn.TIMESTAMP.value, selected_metric]],
@@ -110,19 +88,8 @@ merged_filtered_df = pd.merge(
     validate="m:1"
 )
 
-X = merged_filtered_df[[
-    WeatherColumn.TEMPERATURE.value,
-    WeatherColumn.WIND_SPEED.value,
-    WeatherColumn.HUMIDITY.value,
-    WeatherColumn.RAINFALL.value,
-    WeatherColumn.PRESSURE.value
-]]
 y = merged_filtered_df[selected_metric]
-
-model = LinearRegression()
-model.fit(X, y)
-
-predictions = model.predict(X)
+predictions = predict(model, merged_filtered_df)
 prediction_dates = merged_filtered_df[WeatherColumn.TIMESTAMP.value]
 
 plot_df = pd.DataFrame({
@@ -131,12 +98,11 @@ plot_df = pd.DataFrame({
     "Prognoza": predictions
 })
 
-fig = px.scatter(
+fig = scatter(
     plot_df,
     x="Timestamp",
     y=["Stan faktyczny", "Prognoza"],
-    trendline="ols",
-    trendline_scope="overall",
+    trendline=True,
     title=f"Prognoza opóźnień dla: {selected_category} {selected_value}",
 )
 # fig.update_traces(marker=dict(size=3))
@@ -153,3 +119,5 @@ st.write(
     Może mieć na to wpływ bardzo duża wariancja danych, jak i również niska korelacja pogody z opóźnieniami.
     """
 )
+
+debug_panel()
@@ -1,30 +1,23 @@
-import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from util import TrafficColumn, WeatherColumn, Metric, calculate_traffic_metrics, load_traffic_data, load_weather_data
+from dashboards.widgets import approximate_quantiles, date_range, debug_panel
+from util import Metric, instrument
+from util.cache import sketch_data, traffic_date_range
+from util.precompute import TRAFFIC_GROUPS, dataset
+from util.sketch import SKETCH_DIMENSIONS, sketch_rollup
 
-traffic_df = load_traffic_data()
-weather_df = load_weather_data()
-
-traffic_df[TrafficColumn.TIMESTAMP.value] = pd.to_datetime(traffic_df[TrafficColumn.TIMESTAMP.value]).dt.floor("h")
-weather_df[WeatherColumn.TIMESTAMP.value] = pd.to_datetime(weather_df[WeatherColumn.TIMESTAMP.value])
+instrument.start_run()
+first_day, last_day = date_range(*traffic_date_range())
 
 # ============================== TRAFFIC CATEGORIES ==============================
-traffic_groups = [
-    TrafficColumn.VEHICLE_NO.value,
-    TrafficColumn.BRIGADE.value,
-    TrafficColumn.OUTSIDE.value,
-    TrafficColumn.DAY_TYPE.value
-]
-
-selected_traffic_group = st.selectbox("Kategoria", traffic_groups)
+selected_traffic_group = st.selectbox("Kategoria", TRAFFIC_GROUPS)
 selected_traffic_metric = st.selectbox("Metryka", [e.value for e in Metric])
 
-traffic_metrics_df = (traffic_df
-                      .groupby(selected_traffic_group)[[TrafficColumn.DELAY.value]]
-                      .apply(calculate_traffic_metrics)
-                      .reset_index())
+if selected_traffic_group in SKETCH_DIMENSIONS and approximate_quantiles():
+    traffic_metrics_df = sketch_rollup(sketch_data(), [selected_traffic_group], first_day, last_day)
+else:
+    traffic_metrics_df = dataset("category_stats", first_day, last_day, selected_traffic_group)
 
 fig = px.bar(
     traffic_metrics_df,
@@ -103,3 +96,5 @@ st.write(
     """
 )
 # ===============================================================================
+
+debug_panel()
@@ -0,0 +1,55 @@
+from datetime import date
+from typing import Tuple
+
+import pandas as pd
+import streamlit as st
+
+from util import instrument
+from util.cache import sketch_data
+from util.sketch import ALPHA, DEFAULT_ALPHA, SKETCH_PATH
+from util.storage import TRAFFIC_CSV, path_mtime
+
+
+def date_range(min_date: date, max_date: date) -> Tuple[date, date]:
+    selected = st.sidebar.date_input(
+        "Zakres dat",
+        value=(min_date, max_date),
+        min_value=min_date,
+        max_value=max_date
+    )
+    # While the second day is being picked the widget only returns the first one
+    start, end = (*selected, max_date)[:2]
+    return start, end
+
+
+def approximate_quantiles() -> bool:
+    # The sketch is updated while the traffic files are merged and keyed by day, so it covers any selected range
+    # as long as no merge skipped it
+    if path_mtime(SKETCH_PATH) < path_mtime(TRAFFIC_CSV):
+        return False
+    alpha = sketch_data().attrs.get(ALPHA, DEFAULT_ALPHA)
+    return st.sidebar.toggle(
+        "Przybliżone kwantyle",
+        help=f"Mediana i kwartyle ze szkicu zbudowanego przy scalaniu danych, z błędem względnym do {alpha * 100:g}%"
+    )
+
+
+def debug_panel() -> None:
+    # Sections timed during this rerun, only while profiling is switched on with PAD_PROFILE
+    if not instrument.enabled():
+        return
+    with st.sidebar.expander("Profilowanie"):
+        st.metric("Czas przebiegu", f"{instrument.run_seconds():.2f} s")
+        run_records = instrument.records()
+        if run_records:
+            st.dataframe(
+                pd.DataFrame(run_records)[["section", "seconds", "rows", "peak_rss_mb"]].rename(columns={
+                    "section": "Sekcja",
+                    "seconds": "Czas [s]",
+                    "rows": "Wiersze",
+                    "peak_rss_mb": "Szczyt RSS [MB]",
+                }),
+                hide_index=True
+            )
+        else:
+            st.write("Wszystkie dane pochodziły z pamięci podręcznej.")
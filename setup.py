@@ -1,12 +1,70 @@
+import argparse
+import sys
+from datetime import datetime
+
+from util import instrument
 from util.csv_download import download_all_csvs
+from util.cube import update_cube
+from util.features import write_features
 from util.merge_traffic import merge_traffic
 from util.merge_weather import merge_weather
+from util.models import write_models
+from util.precompute import write_precomputed
+from util.serving import write_serving_files
+from util.sketch import DEFAULT_ALPHA
+from util.stops import update_stop_delays
+from util.storage import write_traffic_store, write_weather_store
 
 CONTAINERS = "gtfs", "traffic", "weather"
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", help="merge only source files added since the last run")
+    parser.add_argument(
+        "--end-date", type=datetime.fromisoformat,
+        help="last hour of traffic files to merge, e.g. 2025-01-02T23:00, the latest downloaded one by default"
+    )
+    parser.add_argument(
+        "--sketch-alpha", type=float, default=DEFAULT_ALPHA,
+        help="relative error of the approximate quantiles sketch, 0 skips the sketch"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="processes parsing traffic files, python -m benchmarks.merge_scaling shows whether more pay off"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help=f"time every stage, with rows and peak memory, into {instrument.LOG_PATH}"
+    )
+    parser.add_argument(
+        "--serving", action="store_true",
+        help="also write memory-mapped files shared by all dashboard processes, for many concurrent users"
+    )
+    args = parser.parse_args()
+    if args.profile:
+        instrument.enable()
+
     for container in CONTAINERS:
         download_all_csvs(container, f"data/{container}")
 
-    merge_traffic()
-    merge_weather()
+    # With --incremental only the appended traffic rows are stored and added to the cube and stop totals,
+    # the tables derived from those aggregates are then rebuilt from them
+    traffic_offset = merge_traffic(
+        sketch_alpha=args.sketch_alpha, incremental=args.incremental, end_date=args.end_date, workers=args.workers
+    )
+    weather_changed = merge_weather(incremental=args.incremental)
+    if traffic_offset is not None:
+        write_traffic_store(offset=traffic_offset)
+    if weather_changed:
+        write_weather_store()
+    if traffic_offset is not None:
+        update_cube(traffic_offset)
+        update_stop_delays(traffic_offset)
+    if traffic_offset is not None or weather_changed:
+        write_features()
+        write_models()
+        if args.serving:
+            write_serving_files()
+        write_precomputed()
+    if instrument.enabled():
+        print(instrument.summary(), file=sys.stderr)
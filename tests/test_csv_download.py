@@ -0,0 +1,98 @@
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from util import csv_download
+from util.csv_download import MANIFEST_NAME, download_all_csvs
+from util.manifest import load_manifest
+
+
+class FakeDownload:
+    def __init__(self, blob):
+        self.blob = blob
+
+    def readinto(self, file) -> int:
+        blob = self.blob
+        blob.downloads += 1
+        if blob.failures:
+            blob.failures -= 1
+            # Half of the blob reaches the disk before the connection drops
+            file.write(blob.data[:len(blob.data) // 2])
+            raise ConnectionError(f"{blob.name} dropped")
+        file.write(blob.data)
+        return len(blob.data)
+
+
+class FakeContainer:
+    # Stands in for azure's ContainerClient, blobs are kept in memory and can fail a given number of times
+    def __init__(self):
+        self.blobs = {}
+
+    def add(self, name: str, data: bytes, failures: int = 0):
+        self.blobs[name] = SimpleNamespace(
+            name=name,
+            data=data,
+            size=len(data),
+            etag=hashlib.sha1(data).hexdigest(),
+            content_settings=SimpleNamespace(content_md5=hashlib.md5(data).digest()),
+            failures=failures,
+            downloads=0,
+        )
+        return self.blobs[name]
+
+    def list_blobs(self):
+        return list(self.blobs.values())
+
+    def get_blob_client(self, name: str):
+        return SimpleNamespace(download_blob=lambda: FakeDownload(self.blobs[name]))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(csv_download, "RETRY_BACKOFF", 0)
+
+
+def test_unchanged_blobs_are_skipped(tmp_path):
+    container = FakeContainer()
+    first = container.add("2024/12/08/delays-00.csv", b"a,b\n1,2\n")
+    container.add("notes.txt", b"not a csv")
+    download_all_csvs("traffic", str(tmp_path), container)
+    download_all_csvs("traffic", str(tmp_path), container)
+    assert first.downloads == 1
+    assert (tmp_path / first.name).read_bytes() == first.data
+    assert not (tmp_path / "notes.txt").exists()
+
+    # A changed blob and a local file that went missing are both fetched again
+    second = container.add("2024/12/08/delays-01.csv", b"a,b\n3,4\n")
+    changed = container.add(first.name, b"a,b\n5,6\n")
+    download_all_csvs("traffic", str(tmp_path), container)
+    os.remove(tmp_path / second.name)
+    download_all_csvs("traffic", str(tmp_path), container)
+    assert changed.downloads == 1 and second.downloads == 2
+    assert (tmp_path / first.name).read_bytes() == changed.data
+
+
+def test_transient_failures_are_retried(tmp_path):
+    container = FakeContainer()
+    blob = container.add("weather-00.csv", b"x" * 1000, failures=2)
+    download_all_csvs("weather", str(tmp_path), container)
+    assert blob.downloads == 3
+    assert (tmp_path / blob.name).read_bytes() == blob.data
+    assert not (tmp_path / f"{blob.name}.part").exists()
+    assert load_manifest(str(tmp_path / MANIFEST_NAME))[blob.name]["size"] == blob.size
+
+
+def test_failed_download_keeps_previous_file(tmp_path):
+    container = FakeContainer()
+    done = container.add("weather-00.csv", b"old")
+    download_all_csvs("weather", str(tmp_path), container)
+
+    container.add(done.name, b"new contents", failures=csv_download.MAX_RETRIES + 1)
+    with pytest.raises(ConnectionError):
+        download_all_csvs("weather", str(tmp_path), container)
+    # The half written .part file never replaced the old one, and the manifest still describes the old one
+    assert (tmp_path / done.name).read_bytes() == b"old"
+    assert not (tmp_path / f"{done.name}.part").exists()
+    assert load_manifest(str(tmp_path / MANIFEST_NAME))[done.name]["size"] == len(b"old")
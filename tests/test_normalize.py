@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+from hypothesis import given, strategies as st
+
+from util.merge_traffic import _normalize, _normalize_brigade, _normalize_delay, _normalize_outside
+
+
+# Scalar versions merge_traffic applied row by row, the vectorized ones have to match them exactly
+def scalar_brigade(brigade: str) -> str:
+    return str(int(float(brigade))) if brigade.isdigit() or brigade.replace(".0", "").isdigit() else brigade
+
+
+def scalar_delay(delay: str) -> int:
+    return -int(delay.split()[0]) if "przed czasem" in delay else int(delay.split()[0])
+
+
+def scalar_outside(outside) -> bool:
+    return pd.notna(outside)
+
+
+brigades = st.one_of(
+    st.integers(0, 99_999).map(str),
+    st.integers(0, 99_999).map(lambda number: f"{number}.0"),
+    st.text(alphabet="0123456789.ABCNZ", min_size=1, max_size=8),
+    st.text(alphabet="0123456789", min_size=16, max_size=40),
+    st.text(alphabet="0123456789", min_size=16, max_size=40).map(lambda digits: f"{digits}.0"),
+)
+delays = st.builds(
+    lambda spaces, minutes, early: f"{spaces}{minutes} min{' przed czasem' if early else ''}",
+    st.sampled_from(["", " ", "  "]),
+    st.integers(0, 10_000),
+    st.booleans(),
+)
+outsides = st.one_of(st.none(), st.just(float("nan")), st.sampled_from(["true", "1", "x"]))
+
+
+def scalar_or_error(function, value):
+    try:
+        return function(value)
+    except ValueError:
+        return ValueError
+
+
+@given(st.lists(brigades, min_size=1))
+def test_brigade_matches_scalar(values):
+    expected = [scalar_or_error(scalar_brigade, value) for value in values]
+    if ValueError in expected:
+        # Text like "1.0.0" passes the digit check and then fails the cast, row by row it stopped the merge too
+        with pytest.raises(ValueError):
+            _normalize_brigade(pd.Series(values, dtype=object))
+    else:
+        assert _normalize_brigade(pd.Series(values, dtype=object)).tolist() == expected
+
+
+@given(st.lists(delays, min_size=1))
+def test_delay_matches_scalar(values):
+    assert _normalize_delay(pd.Series(values, dtype=object)).tolist() == [scalar_delay(value) for value in values]
+
+
+@given(st.lists(outsides, min_size=1))
+def test_outside_matches_scalar(values):
+    assert _normalize_outside(pd.Series(values, dtype=object)).tolist() == [scalar_outside(value) for value in values]
+
+
+@given(st.lists(st.tuples(st.integers(0, 999).map(str), delays, outsides), min_size=1))
+def test_normalize_matches_scalar(rows):
+    # Repeated values are parsed once per distinct value, the result is the same as parsing every row
+    df = pd.DataFrame(rows + rows, columns=["Brigade", "Delay", "Outside"], dtype=object)
+    expected = pd.DataFrame({
+        "Brigade": df["Brigade"].apply(scalar_brigade),
+        "Delay": df["Delay"].apply(scalar_delay),
+        "Outside": df["Outside"].apply(scalar_outside),
+    })
+    actual = _normalize(df.copy())
+    assert actual["Brigade"].tolist() == expected["Brigade"].tolist()
+    assert actual["Delay"].tolist() == expected["Delay"].tolist()
+    assert actual["Outside"].tolist() == expected["Outside"].tolist()
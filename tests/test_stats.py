@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+from hypothesis import given, strategies as st
+
+from util import Metric, TrafficColumn, calculate_delay_stats, calculate_group_stats, calculate_traffic_metrics
+
+DELAY = TrafficColumn.DELAY.value
+TIMESTAMP = TrafficColumn.TIMESTAMP.value
+VEHICLE_NO = TrafficColumn.VEHICLE_NO.value
+
+
+# Pandas aggregations the segment statistics replaced, they have to give the same numbers
+def pandas_delay_stats(traffic: pd.DataFrame) -> pd.DataFrame:
+    return traffic.groupby(TIMESTAMP)[DELAY].agg(
+        mean="mean",
+        median="median",
+        std_dev="std",
+        q1=lambda x: np.quantile(x, 0.25),
+        q3=lambda x: np.quantile(x, 0.75),
+        count="count"
+    ).reset_index()
+
+
+def pandas_traffic_metrics(group: pd.DataFrame) -> pd.Series:
+    return pd.Series({
+        Metric.MEAN.value: group[DELAY].mean(),
+        Metric.MEDIAN.value: group[DELAY].median(),
+        Metric.STD_DEV.value: group[DELAY].std(),
+        Metric.Q1.value: group[DELAY].quantile(0.25),
+        Metric.Q3.value: group[DELAY].quantile(0.75),
+        Metric.COUNT.value: group[DELAY].count(),
+    })
+
+
+def pandas_group_stats(traffic: pd.DataFrame, by) -> pd.DataFrame:
+    return traffic.groupby(by, observed=True)[[DELAY]].apply(pandas_traffic_metrics).reset_index()
+
+
+def assert_stats_equal(actual: pd.DataFrame, expected: pd.DataFrame, keys: int) -> None:
+    assert len(actual) == len(expected)
+    assert actual.iloc[:, :keys].astype(str).equals(expected.iloc[:, :keys].astype(str))
+    assert np.allclose(actual.iloc[:, keys:].to_numpy(float), expected.iloc[:, keys:].to_numpy(float), equal_nan=True)
+
+
+def traffic(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=[TIMESTAMP, VEHICLE_NO, DELAY]).astype({
+        TIMESTAMP: "datetime64[ns]", VEHICLE_NO: "category", DELAY: "float64"
+    })
+
+
+timestamps = st.integers(0, 5).map(lambda hour: pd.Timestamp("2024-12-08") + pd.Timedelta(hours=hour))
+vehicles = st.sampled_from(["1001", "1002", "2003"])
+whole_delays = st.integers(-60, 400)
+delays = st.one_of(whole_delays, st.just(np.nan))
+
+
+@given(st.lists(st.tuples(timestamps, vehicles, whole_delays)))
+def test_delay_stats_match_pandas(rows):
+    df = traffic(rows).astype({DELAY: "int16"})
+    assert_stats_equal(calculate_delay_stats(df), pandas_delay_stats(df), 1)
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+@given(st.lists(st.tuples(timestamps, vehicles, delays)))
+def test_group_stats_skip_missing_delays(rows):
+    # A group whose delays are all missing keeps its row, with count 0 and no statistics
+    df = traffic(rows)
+    for by in ([TIMESTAMP], [VEHICLE_NO], [TIMESTAMP, VEHICLE_NO]):
+        assert_stats_equal(calculate_group_stats(df, by), pandas_group_stats(df, by), len(by))
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+@given(st.lists(delays))
+def test_traffic_metrics_match_pandas(values):
+    df = pd.DataFrame({DELAY: pd.Series(values, dtype="float64")})
+    actual, expected = calculate_traffic_metrics(df), pandas_traffic_metrics(df)
+    assert actual.index.tolist() == expected.index.tolist()
+    assert np.allclose(actual.to_numpy(float), expected.to_numpy(float), equal_nan=True)
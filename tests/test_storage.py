@@ -0,0 +1,102 @@
+from contextlib import chdir
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate
+from util import TrafficColumn, calculate_group_stats, load_traffic_data
+from util import merge_traffic as merge_module
+from util.cube import CUBE_PATH, load_cube, rollup, update_cube
+from util.merge_traffic import START_DATE, merge_traffic
+from util.registry import load_model, load_or_fit, save_model
+from util.storage import TRAFFIC_MAPPED, iter_traffic, read_traffic, write_mapped, write_traffic_store
+
+DAYS = 2
+END_DATE = START_DATE + timedelta(days=DAYS, hours=-1)
+
+
+def _merge(end_date, incremental: bool = False) -> None:
+    offset = merge_traffic(incremental=incremental, end_date=end_date)
+    write_traffic_store(offset=offset)
+    update_cube(offset)
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.astype({column: str for column in df.select_dtypes("category")})
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def full(tmp_path_factory):
+    root = tmp_path_factory.mktemp("full")
+    generate(str(root), DAYS, 300)
+    with chdir(root):
+        _merge(END_DATE)
+    return root
+
+
+def test_mapped_reads_match_store(full):
+    filters = [(TrafficColumn.TYPE_OG.value, "in", ["Tramwaj"]), (TrafficColumn.TIMESTAMP.value, ">=", START_DATE)]
+    with chdir(full):
+        stored, stored_filtered = read_traffic(), read_traffic(filters=filters)
+        write_mapped(TRAFFIC_MAPPED, iter_traffic(chunk_size=100))
+        try:
+            pd.testing.assert_frame_equal(_sorted(read_traffic()), _sorted(stored))
+            pd.testing.assert_frame_equal(_sorted(read_traffic(filters=filters)), _sorted(stored_filtered))
+        finally:
+            (full / TRAFFIC_MAPPED).unlink()
+
+
+def test_cube_rollup_matches_exact_stats(full):
+    by = [TrafficColumn.TYPE.value, TrafficColumn.OUTSIDE.value]
+    with chdir(full):
+        expected = calculate_group_stats(load_traffic_data(), by)
+        actual = rollup(load_cube(), by)
+    pd.testing.assert_frame_equal(_sorted(actual), _sorted(expected), check_dtype=False)
+
+
+def test_incremental_merge_matches_full(full, tmp_path):
+    generate(str(tmp_path), DAYS, 300)
+    with chdir(tmp_path):
+        _merge(START_DATE + timedelta(days=1, hours=-1))
+        _merge(END_DATE, incremental=True)
+        incremental_traffic, incremental_cube = read_traffic(), pd.read_parquet(CUBE_PATH)
+    with chdir(full):
+        full_traffic, full_cube = read_traffic(), pd.read_parquet(CUBE_PATH)
+    pd.testing.assert_frame_equal(_sorted(incremental_traffic), _sorted(full_traffic))
+    pd.testing.assert_frame_equal(_sorted(incremental_cube), _sorted(full_cube))
+
+
+def test_interrupted_merge_is_recovered(full, tmp_path, monkeypatch):
+    generate(str(tmp_path), DAYS, 300)
+    # Few days of hashes held in memory, so the others go through the staging directory
+    monkeypatch.setattr(merge_module, "SEEN_DAYS", 1)
+    with chdir(tmp_path):
+        _merge(START_DATE + timedelta(days=1, hours=-1))
+
+        def interrupt(rows):
+            raise KeyboardInterrupt
+
+        # The run stops right after writing its first batch
+        monkeypatch.setattr(merge_module, "count", interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            merge_traffic(memory_budget=1, incremental=True, end_date=END_DATE)
+        monkeypatch.undo()
+        _merge(END_DATE, incremental=True)
+        recovered_traffic, recovered_cube = read_traffic(), pd.read_parquet(CUBE_PATH)
+    with chdir(full):
+        full_traffic, full_cube = read_traffic(), pd.read_parquet(CUBE_PATH)
+    pd.testing.assert_frame_equal(_sorted(recovered_traffic), _sorted(full_traffic))
+    pd.testing.assert_frame_equal(_sorted(recovered_cube), _sorted(full_cube))
+
+
+def test_registry_rejects_hash_mismatch(tmp_path):
+    model = pd.DataFrame({"value": [1.0, 2.0]})
+    save_model("model", model, "inputs-a", str(tmp_path))
+    assert load_model("model", "inputs-b", str(tmp_path)) is None
+    pd.testing.assert_frame_equal(load_model("model", "inputs-a", str(tmp_path)), model)
+
+    refitted = pd.DataFrame({"value": [3.0]})
+    assert load_or_fit("model", "inputs-b", lambda: refitted, str(tmp_path)).equals(refitted)
+    assert load_model("model", "inputs-a", str(tmp_path)) is None
@@ -1,93 +1,97 @@
-from enum import Enum
+from datetime import date
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
+from holidays.countries import Poland
 
+from util.instrument import count, timed
+from util.schema import (
+    DAY_TYPES, TRAFFIC_DTYPES, WEATHER_DTYPES, DayType, Metric, TrafficColumn, Type, WeatherColumn, memory_report
+)
+from util.stats import STATS, segment_starts, segment_stats, sort_groups
+from util.storage import Filters, iter_traffic, read_traffic, read_weather, weather_columns
 
-class Type(Enum):
-    STRING = "str"
-    DOUBLE = "float64"
-    BOOL = "bool"
-
-
-class TrafficColumn(Enum):
-    BRIGADE_OG = "Brigade"
-    BRIGADE = "Brygada"
-    ROUTE_OG = "Route"
-    ROUTE = "Linia"
-    VEHICLE_NO_OG = "Vehicle No"
-    VEHICLE_NO = "Numer pojazdu"
-    DELAY_OG = "Delay"
-    DELAY = "Opóźnienie"
-    OUTSIDE_OG = "Outside"
-    OUTSIDE = "Poza trasą"
-    TIMESTAMP = "Timestamp"
-    DAY_TYPE = "Typ dnia"
-
-
-class DayType(Enum):
-    WEEKDAY = "Dzień roboczy"
-    WEEKEND = "Weekend"
-    HOLIDAY = "Święto"
-
-
-class WeatherColumn(Enum):
-    TEMPERATURE_OG = "temperatura"
-    TEMPERATURE = "Temperatura"
-    WIND_SPEED_OG = "predkosc_wiatru"
-    WIND_SPEED = "Prędkość wiatru"
-    HUMIDITY_OG = "wilgotnosc_wzgledna"
-    HUMIDITY = "Wilgotność względna"
-    RAINFALL_OG = "suma_opadu"
-    RAINFALL = "Suma opadu"
-    PRESSURE_OG = "cisnienie"
-    PRESSURE = "Ciśnienie"
-    TIMESTAMP = "timestamp"
-    DAY_TYPE = "Typ dnia"
-
-
-class Metric(Enum):
-    MEAN = "Średnia"
-    MEDIAN = "Mediana"
-    STD_DEV = "Odchylenie standardowe"
-    Q1 = "25 centyl"
-    Q3 = "75 centyl"
-    COUNT = "Ilość"
-
-
-def load_traffic_data() -> pd.DataFrame:
-    traffic_df = pd.read_csv(
-        "data/traffic/delays-merged.csv",
-        dtype={
-            TrafficColumn.VEHICLE_NO_OG.value: Type.STRING.value,
-            TrafficColumn.BRIGADE_OG.value: Type.STRING.value,
-            TrafficColumn.DELAY_OG.value: Type.DOUBLE.value,
-            TrafficColumn.OUTSIDE_OG.value: Type.BOOL.value,
-        },
-        usecols=lambda col: col in [e.value for e in TrafficColumn if "OG" in e.name] + [TrafficColumn.TIMESTAMP.value]
-    )
-    traffic_df.rename(
+
+def _traffic_columns() -> list:
+    return [e.value for e in TrafficColumn if "OG" in e.name] + [TrafficColumn.TIMESTAMP.value]
+
+
+def rename_traffic(traffic_df: pd.DataFrame) -> pd.DataFrame:
+    # Without copying, frames read from the memory-mapped files stay views of the shared pages
+    return traffic_df.rename(
         columns={
             e.value: TrafficColumn[e.name.replace("_OG", "")].value
             for e in TrafficColumn if "_OG" in e.name
         },
-        inplace=True
+        copy=False
     )
-    return traffic_df
-
-
-def load_weather_data() -> pd.DataFrame:
-    weather_df = pd.read_csv(
-        "data/weather/weather-merged.csv",
-        dtype={
-            WeatherColumn.TEMPERATURE_OG.value: Type.DOUBLE.value,
-            WeatherColumn.WIND_SPEED_OG.value: Type.DOUBLE.value,
-            WeatherColumn.HUMIDITY_OG.value: Type.DOUBLE.value,
-            WeatherColumn.RAINFALL_OG.value: Type.DOUBLE.value,
-            WeatherColumn.PRESSURE_OG.value: Type.DOUBLE.value,
-            WeatherColumn.TIMESTAMP.value: Type.STRING.value
-        },
-        usecols=lambda col: col not in ("id_stacji", "stacja", "kierunek_wiatru")
+
+
+def date_bounds(start: Optional[date] = None, end: Optional[date] = None) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    # Both days are inclusive, the upper bound is the midnight after end
+    return (
+        pd.Timestamp(start) if start is not None else None,
+        pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None,
+    )
+
+
+def in_date_range(timestamps: pd.Series, start: Optional[date] = None, end: Optional[date] = None) -> pd.Series:
+    lower, upper = date_bounds(start, end)
+    mask = pd.Series(True, index=timestamps.index)
+    if lower is not None:
+        mask &= timestamps >= lower
+    if upper is not None:
+        mask &= timestamps < upper
+    return mask
+
+
+def traffic_filters(
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        vehicle_types: Optional[List[str]] = None,
+        routes: Optional[List[str]] = None
+) -> Filters:
+    lower, upper = date_bounds(start, end)
+    filters = []
+    if lower is not None:
+        filters.append((TrafficColumn.TIMESTAMP.value, ">=", lower))
+    if upper is not None:
+        filters.append((TrafficColumn.TIMESTAMP.value, "<", upper))
+    if vehicle_types:
+        filters.append((TrafficColumn.TYPE_OG.value, "in", list(vehicle_types)))
+    if routes:
+        filters.append((TrafficColumn.ROUTE_OG.value, "in", list(routes)))
+    return filters
+
+
+def load_traffic_data(
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        vehicle_types: Optional[List[str]] = None,
+        routes: Optional[List[str]] = None,
+        filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    filters = traffic_filters(start, end, vehicle_types, routes) + (filters or [])
+    return rename_traffic(read_traffic(columns=_traffic_columns(), filters=filters or None))
+
+
+def iter_traffic_data(
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        vehicle_types: Optional[List[str]] = None,
+        routes: Optional[List[str]] = None,
+        filters: Optional[Filters] = None
+) -> Iterator[pd.DataFrame]:
+    filters = traffic_filters(start, end, vehicle_types, routes) + (filters or [])
+    for chunk in iter_traffic(columns=_traffic_columns(), filters=filters or None):
+        yield rename_traffic(chunk)
+
+
+def load_weather_data(filters: Optional[Filters] = None) -> pd.DataFrame:
+    weather_df = read_weather(
+        columns=[col for col in weather_columns() if col not in ("id_stacji", "stacja", "kierunek_wiatru")],
+        filters=filters
     )
     weather_df.rename(
         columns={
@@ -99,35 +103,65 @@ def load_weather_data() -> pd.DataFrame:
     return weather_df
 
 
+def day_type(timestamps: pd.Series) -> pd.Series:
+    # Classified once per distinct date, rows only pick up the code of their date, missing timestamps stay NaN
+    codes, unique_dates = pd.factorize(timestamps.dt.normalize())
+    unique_dates = pd.Series(unique_dates)
+    pl_holidays = Poland(years=unique_dates.dt.year.unique().tolist())
+    lookup = np.full(len(unique_dates) + 1, DAY_TYPES.categories.get_loc(DayType.WEEKDAY.value), dtype=np.int8)
+    lookup[:-1][unique_dates.dt.weekday.to_numpy() >= 5] = DAY_TYPES.categories.get_loc(DayType.WEEKEND.value)
+    lookup[:-1][unique_dates.dt.date.isin(list(pl_holidays)).to_numpy()] = \
+        DAY_TYPES.categories.get_loc(DayType.HOLIDAY.value)
+    lookup[-1] = -1
+    return pd.Series(pd.Categorical.from_codes(lookup[codes], dtype=DAY_TYPES), index=timestamps.index)
+
+
+def concat_frames(frames: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    # Empty parts are left out, otherwise concat warns that their dtypes will count in a future pandas
+    frames = list(frames)
+    return pd.concat([frame for frame in frames if len(frame)] or frames[:1], ignore_index=True)
+
+
+def metric_frame(stats: dict) -> pd.DataFrame:
+    return pd.DataFrame({Metric[name.upper()].value: stats[name] for name in STATS})
+
+
+def _group_codes(traffic: pd.DataFrame, by: List[str]) -> Tuple[np.ndarray, pd.DataFrame]:
+    factorized = [pd.factorize(traffic[column], sort=True) for column in by]
+    valid = np.logical_and.reduce([codes >= 0 for codes, _ in factorized])
+    combined = np.zeros(len(traffic), dtype=np.int64)
+    for codes, uniques in factorized:
+        combined = combined * len(uniques) + codes
+    group_codes, group_keys = pd.factorize(combined[valid], sort=True)
+    codes = np.full(len(traffic), -1, dtype=np.int64)
+    codes[valid] = group_codes
+    positions = np.unravel_index(group_keys, [max(len(uniques), 1) for _, uniques in factorized])
+    keys = pd.DataFrame({
+        column: uniques.take(position)
+        for column, (_, uniques), position in zip(by, factorized, positions)
+    })
+    return codes, keys
+
+
+@timed("calculate_group_stats")
+def calculate_group_stats(traffic: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+    count(len(traffic))
+    codes, keys = _group_codes(traffic, by)
+    delays = traffic[TrafficColumn.DELAY.value].to_numpy()
+    # Missing delays are left out like the pandas aggregations skipped them, a group with none keeps a row of count 0
+    sorted_codes, values = sort_groups(np.where(pd.isna(delays), -1, codes), delays)
+    starts = segment_starts(sorted_codes)
+    stats = metric_frame(segment_stats(values, starts)).set_axis(sorted_codes[starts]).reindex(range(len(keys)))
+    stats[Metric.COUNT.value] = stats[Metric.COUNT.value].fillna(0).astype(np.int64)
+    return pd.concat([keys, stats.reset_index(drop=True)], axis=1)
+
+
 def calculate_delay_stats(traffic: pd.DataFrame) -> pd.DataFrame:
-    delay_stats_df = traffic.groupby(TrafficColumn.TIMESTAMP.value)[TrafficColumn.DELAY.value].agg(
-        mean=np.mean,
-        median=np.median,
-        std_dev=np.std,
-        q1=lambda x: np.quantile(x, 0.25),
-        q3=lambda x: np.quantile(x, 0.75),
-        count="count"
-    ).reset_index()
-    delay_stats_df.rename(
-        columns={
-            "mean": Metric.MEAN.value,
-            "median": Metric.MEDIAN.value,
-            "std_dev": Metric.STD_DEV.value,
-            "q1": Metric.Q1.value,
-            "q3": Metric.Q3.value,
-            "count": Metric.COUNT.value
-        },
-        inplace=True
-    )
-    return delay_stats_df
+    return calculate_group_stats(traffic, [TrafficColumn.TIMESTAMP.value])
 
 
 def calculate_traffic_metrics(group: pd.DataFrame) -> pd.Series:
-    return pd.Series({
-        Metric.MEAN.value: group[TrafficColumn.DELAY.value].mean(),
-        Metric.MEDIAN.value: group[TrafficColumn.DELAY.value].median(),
-        Metric.STD_DEV.value: group[TrafficColumn.DELAY.value].std(),
-        Metric.Q1.value: group[TrafficColumn.DELAY.value].quantile(0.25),
-        Metric.Q3.value: group[TrafficColumn.DELAY.value].quantile(0.75),
-        Metric.COUNT.value: group[TrafficColumn.DELAY.value].count(),
-    })
+    values = np.sort(group[TrafficColumn.DELAY.value].dropna().to_numpy(np.float64))
+    if not len(values):
+        return pd.Series({**{Metric[name.upper()].value: np.nan for name in STATS}, Metric.COUNT.value: 0})
+    return metric_frame(segment_stats(values, np.zeros(1, dtype=np.int64))).iloc[0].rename(None)
@@ -0,0 +1,146 @@
+import threading
+from collections import Counter
+from datetime import date
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+from util import load_weather_data, WeatherColumn
+from util.cube import CUBE_PATH, load_cube
+from util.features import FEATURES_PATH, load_features
+from util.instrument import timed
+from util.models import registered_models
+from util.sketch import SKETCH_PATH, load_sketch
+from util.stops import STOP_DELAYS_PATH, load_stop_delays
+from util.storage import (
+    DAY, Filters, path_mtime, read_traffic, traffic_days, traffic_mtime, weather_mtime
+)
+
+MAX_VARIANTS = 8
+
+# Every caller gets a shallow copy of the cached frame, with copy on write a session writing into its copy gets
+# arrays of its own instead of changing the frame all other sessions see
+pd.set_option("mode.copy_on_write", True)
+
+# Guards the dictionaries only, a frame is loaded under its own key's lock, so a slow miss doesn't hold up other
+# frames or other sessions' hits
+_lock = threading.Lock()
+_frames: Dict[Tuple[Hashable, ...], pd.DataFrame] = {}
+_loading: Dict[Tuple[Hashable, ...], threading.Lock] = {}
+_stats = Counter()
+
+
+def _freeze(value) -> Hashable:
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _cached(
+        key: Tuple[Hashable, ...],
+        mtime: float,
+        load: Callable[[], pd.DataFrame],
+        max_variants: Optional[int] = None
+) -> pd.DataFrame:
+    entry = (*key, mtime)
+    with _lock:
+        if entry in _frames:
+            _stats["hits"] += 1
+            return _frames[entry].copy(deep=False)
+        key_lock = _loading.setdefault(key, threading.Lock())
+
+    try:
+        with key_lock:
+            # Sessions asking for the same frame meanwhile wait here and take the one loaded first
+            with _lock:
+                if entry in _frames:
+                    _stats["hits"] += 1
+                    return _frames[entry].copy(deep=False)
+                _stats["misses"] += 1
+            with timed(f"load {key[0]}"):
+                frame = load()
+            with _lock:
+                for stale in [k for k in _frames if k[:-1] == key]:
+                    del _frames[stale]
+                _frames[entry] = frame
+                if max_variants is not None:
+                    # Oldest parameter sets of the same frame go first
+                    for old in [k for k in _frames if k[0] == key[0]][:-max_variants]:
+                        del _frames[old]
+                return frame.copy(deep=False)
+    finally:
+        with _lock:
+            # A lock only lives while a load of its key is in flight, a later miss gets a new one
+            if _loading.get(key) is key_lock:
+                del _loading[key]
+
+
+def cache_stats() -> Dict[str, int]:
+    with _lock:
+        return {"hits": _stats["hits"], "misses": _stats["misses"], "entries": len(_frames)}
+
+
+def clear_cache() -> None:
+    with _lock:
+        _frames.clear()
+        _loading.clear()
+        _stats.clear()
+
+
+def weather_data(filters: Optional[Filters] = None) -> pd.DataFrame:
+    def load():
+        weather_df = load_weather_data(filters)
+        weather_df[WeatherColumn.TIMESTAMP.value] = pd.to_datetime(weather_df[WeatherColumn.TIMESTAMP.value])
+        return weather_df
+
+    return _cached(("weather", _freeze(filters)), weather_mtime(), load)
+
+
+def raw_traffic_data(columns: Optional[List[str]] = None, filters: Optional[Filters] = None) -> pd.DataFrame:
+    return _cached(
+        ("raw_traffic", _freeze(columns), _freeze(filters)),
+        traffic_mtime(),
+        lambda: read_traffic(columns, filters)
+    )
+
+
+def traffic_date_range() -> Tuple[date, date]:
+    days = _cached(("traffic_days",), traffic_mtime(), lambda: pd.DataFrame({DAY: traffic_days()}))[DAY]
+    return date.fromisoformat(days.iloc[0]), date.fromisoformat(days.iloc[-1])
+
+
+def cube_data() -> pd.DataFrame:
+    return _cached(("cube",), max(path_mtime(CUBE_PATH), traffic_mtime()), load_cube)
+
+
+def features_data() -> pd.DataFrame:
+    return _cached(
+        ("features",),
+        max(path_mtime(FEATURES_PATH, CUBE_PATH), traffic_mtime(), weather_mtime()),
+        load_features
+    )
+
+
+def model_data(name: str) -> pd.DataFrame:
+    # Only hashes the inputs when the data files change, the models are fitted again only if their content did
+    return _cached(
+        ("models", name),
+        max(path_mtime(CUBE_PATH), traffic_mtime(), weather_mtime()),
+        lambda: registered_models(name, cube_data(), weather_data())
+    )
+
+
+def sketch_data() -> pd.DataFrame:
+    return _cached(("sketch",), path_mtime(SKETCH_PATH), load_sketch)
+
+
+def stop_delay_data() -> pd.DataFrame:
+    return _cached(("stop_delays",), max(path_mtime(STOP_DELAYS_PATH), traffic_mtime()), load_stop_delays)
+
+
+def table_data(path: str) -> pd.DataFrame:
+    return _cached(("table", path), path_mtime(path), lambda: pd.read_parquet(path))
+
+
+def derived_data(name: str, params: Tuple[Hashable, ...], load: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    return _cached((name, _freeze(params)), max(traffic_mtime(), weather_mtime()), load, MAX_VARIANTS)
@@ -1,12 +1,24 @@
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
 
 import dotenv
-from azure.storage.blob import BlobServiceClient, ContainerClient, BlobClient
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from azure.storage.blob import BlobServiceClient, ContainerClient, BlobClient, BlobProperties
+
+from util.instrument import timed
+from util.manifest import load_manifest, save_manifest
 
 dotenv.load_dotenv()
 AZURE_CONNECTION_STRING = os.getenv("AZURE_CONN_STRING")
 
+MANIFEST_NAME = ".manifest.json"
+MAX_WORKERS = 8
+MAX_RETRIES = 3
+RETRY_BACKOFF = 2.0
+
 
 def get_blob_service_client() -> BlobServiceClient:
     return BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
@@ -20,19 +32,75 @@ def get_blob_client(container_client: ContainerClient, blob_name: str) -> BlobCl
     return container_client.get_blob_client(blob_name)
 
 
-def download_all_csvs(container: str, dir: str) -> None:
-    blob_service_client = get_blob_service_client()
-    container_client = get_container_client(blob_service_client, container)
+def _manifest_entry(blob: BlobProperties) -> dict:
+    md5 = blob.content_settings.content_md5 if blob.content_settings else None
+    return {"size": blob.size, "etag": blob.etag, "md5": bytes(md5).hex() if md5 else None}
+
+
+def _is_current(local_path: str, entry: Optional[dict], blob: BlobProperties) -> bool:
+    return (
+            entry == _manifest_entry(blob)
+            and os.path.exists(local_path)
+            and os.path.getsize(local_path) == blob.size
+    )
+
+
+def _download_blob(container_client: ContainerClient, blob: BlobProperties, local_path: str) -> int:
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with open(f"{local_path}.part", "wb") as file:
+                size = get_blob_client(container_client, blob.name).download_blob().readinto(file)
+            os.replace(f"{local_path}.part", local_path)
+            return size
+        except (ServiceRequestError, ServiceResponseError, ConnectionError, TimeoutError):
+            if attempt == MAX_RETRIES:
+                if os.path.exists(f"{local_path}.part"):
+                    os.remove(f"{local_path}.part")
+                raise
+            print(f"Retrying {blob.name} ({attempt + 1}/{MAX_RETRIES})", file=sys.stderr)
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+@timed("download_all_csvs")
+def download_all_csvs(
+        container: str,
+        dir: str,
+        container_client: Optional[ContainerClient] = None,
+        max_workers: int = MAX_WORKERS
+) -> None:
+    if container_client is None:
+        container_client = get_container_client(get_blob_service_client(), container)
     if not os.path.exists(dir):
         print(f"{dir} didn't exist, creating it", file=sys.stderr)
         os.makedirs(dir)
+
+    manifest_path = os.path.join(dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    pending = []
     for blob in container_client.list_blobs():
-        if blob.name.endswith(".csv"):
-            local_path = os.path.join(dir, blob.name)
+        if not blob.name.endswith(".csv"):
+            continue
+        if _is_current(os.path.join(dir, blob.name), manifest.get(blob.name), blob):
+            continue
+        pending.append(blob)
+    print(f"{dir}: {len(pending)} files to download, {len(manifest)} already in manifest", file=sys.stderr)
 
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    start, downloaded = time.perf_counter(), 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_download_blob, container_client, blob, os.path.join(dir, blob.name)): blob
+            for blob in pending
+        }
+        try:
+            for future in as_completed(futures):
+                blob = futures[future]
+                downloaded += future.result()
+                manifest[blob.name] = _manifest_entry(blob)
+                print(f"Downloaded {dir}/{blob.name}", file=sys.stderr)
+        finally:
+            save_manifest(manifest_path, manifest)
 
-            print(f"Downloading {dir}/{blob.name}", file=sys.stderr)
-            with open(local_path, "wb") as file:
-                blob_client = container_client.get_blob_client(blob)
-                file.write(blob_client.download_blob().readall())
+    elapsed, mib = time.perf_counter() - start, downloaded / 1024 ** 2
+    if pending:
+        print(f"{dir}: {mib:.1f} MiB in {elapsed:.1f}s ({mib / max(elapsed, 1e-9):.1f} MiB/s)", file=sys.stderr)
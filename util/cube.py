@@ -0,0 +1,186 @@
+import os
+from datetime import date
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from util import (
+    TrafficColumn, concat_frames, day_type, iter_traffic_data, load_traffic_data, metric_frame, rename_traffic
+)
+from util.instrument import count, counted, timed
+from util.stats import segment_starts, segment_stats
+from util.storage import iter_traffic_csv, mapped_frame, mapped_table, path_mtime
+
+CUBE_PATH = "data/traffic/delays-cube.parquet"
+CUBE_MAPPED = "data/traffic/delays-cube.arrow"
+COUNT = "count"
+MAX_PARTIAL_ROWS = 5_000_000
+
+DIMENSIONS = [
+    TrafficColumn.TIMESTAMP.value,
+    TrafficColumn.TYPE.value,
+    TrafficColumn.ROUTE.value,
+    TrafficColumn.BRIGADE.value,
+    TrafficColumn.VEHICLE_NO.value,
+    TrafficColumn.OUTSIDE.value,
+    TrafficColumn.DAY_TYPE.value,
+]
+
+
+def _aggregate(df: pd.DataFrame, count: pd.Series) -> pd.DataFrame:
+    return (count
+            .groupby([df[c] for c in DIMENSIONS + [TrafficColumn.DELAY.value]], observed=True, dropna=False)
+            .sum()
+            .rename(COUNT)
+            .reset_index())
+
+
+def build_cube(traffic: pd.DataFrame) -> pd.DataFrame:
+    traffic = traffic.assign(**{
+        TrafficColumn.TIMESTAMP.value: traffic[TrafficColumn.TIMESTAMP.value].dt.floor("h"),
+        TrafficColumn.DAY_TYPE.value: day_type(traffic[TrafficColumn.TIMESTAMP.value]),
+    })
+    return _aggregate(traffic, pd.Series(1, index=traffic.index, dtype=np.int64))
+
+
+def _combine(partials: List[pd.DataFrame], keys: List[str]) -> pd.DataFrame:
+    combined = concat_frames(partials)
+    return (combined[COUNT]
+            .groupby([combined[c] for c in keys], observed=True, dropna=False)
+            .sum()
+            .reset_index())
+
+
+def merge_partials(partials: Iterable[pd.DataFrame], keys: List[str], max_rows: int = MAX_PARTIAL_ROWS) -> pd.DataFrame:
+    # Partial counts are summed whenever the pending ones outgrow max_rows, so memory follows the number of
+    # distinct keys rather than the number of records
+    pending, rows = [], 0
+    for partial in partials:
+        pending.append(partial)
+        rows += len(partial)
+        if rows > max_rows:
+            pending = [_combine(pending, keys)]
+            rows = len(pending[0])
+            # Otherwise a merged frame close to the limit would be merged again after every chunk
+            max_rows = max(max_rows, 2 * rows)
+    if not pending:
+        return pd.DataFrame(columns=keys + [COUNT])
+    return _combine(pending, keys)
+
+
+def _write(cube: pd.DataFrame, path: str) -> None:
+    for column in DIMENSIONS:
+        if cube[column].dtype == object:
+            cube[column] = cube[column].astype("category")
+    cube.to_parquet(path, index=False, compression="zstd")
+
+
+@timed("write_cube")
+def write_cube(path: str = CUBE_PATH) -> None:
+    # Cells of one hour can be split between chunks, so partial cubes are summed once more
+    cube = merge_partials((build_cube(chunk) for chunk in counted(iter_traffic_data())), DIMENSIONS + [TrafficColumn.DELAY.value])
+    _write(cube, path)
+
+
+@timed("update_cube")
+def update_cube(offset: int, path: str = CUBE_PATH) -> None:
+    # Counts add up, so only the cells of the days that got rows are summed with the cube of the appended rows
+    if offset == 0 or not os.path.exists(path):
+        write_cube(path)
+        return
+    keys = DIMENSIONS + [TrafficColumn.DELAY.value]
+    added = merge_partials(
+        (build_cube(rename_traffic(chunk)) for chunk in counted(iter_traffic_csv(offset))), keys
+    )
+    if added.empty:
+        return
+    cube = pd.read_parquet(path)
+    count(len(cube))
+    days = cube[TrafficColumn.TIMESTAMP.value].dt.normalize()
+    affected = days.isin(added[TrafficColumn.TIMESTAMP.value].dt.normalize().unique())
+    _write(concat_frames([cube[~affected], _combine([cube[affected], added], keys)]), path)
+
+
+def load_cube(path: str = CUBE_PATH, mapped_path: str = CUBE_MAPPED) -> pd.DataFrame:
+    mapped = mapped_table(mapped_path, path_mtime(path))
+    if mapped is not None:
+        return mapped_frame(mapped)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    return build_cube(load_traffic_data())
+
+
+@timed("rollup")
+def rollup(cube: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+    count(len(cube))
+    # Delay is whole minutes, so each cube cell holds an exact histogram and quantiles come out exact
+    histogram = (cube
+                 .groupby(by + [TrafficColumn.DELAY.value], observed=True)[COUNT]
+                 .sum()
+                 .reset_index())
+    histogram = histogram[histogram[COUNT] > 0].reset_index(drop=True)
+    groups = histogram.groupby(by, observed=True, sort=False).ngroup().to_numpy()
+    starts = segment_starts(groups)
+    stats = segment_stats(
+        histogram[TrafficColumn.DELAY.value].to_numpy(np.float64),
+        starts,
+        histogram[COUNT].to_numpy(np.int64)
+    )
+    return pd.concat(
+        [
+            histogram.loc[starts, by].reset_index(drop=True),
+            metric_frame(stats),
+        ],
+        axis=1
+    )
+
+
+@timed("chunked_group_stats")
+def chunked_group_stats(
+        chunks: Iterable[pd.DataFrame],
+        by: List[str],
+        max_rows: int = MAX_PARTIAL_ROWS
+) -> pd.DataFrame:
+    # Same columns as calculate_group_stats, every chunk is first reduced to the delay histogram of its groups
+    histograms = (
+        chunk.groupby(by + [TrafficColumn.DELAY.value], observed=True).size().rename(COUNT).reset_index()
+        for chunk in counted(chunks)
+    )
+    return rollup(merge_partials(histograms, by + [TrafficColumn.DELAY.value], max_rows), by)
+
+
+def chunked_delay_stats(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    return chunked_group_stats(chunks, [TrafficColumn.TIMESTAMP.value])
+
+
+@timed("chunked_traffic_metrics")
+def chunked_traffic_metrics(chunks: Iterable[pd.DataFrame]) -> pd.Series:
+    histograms = (chunk[TrafficColumn.DELAY.value].value_counts().rename(COUNT).reset_index() for chunk in counted(chunks))
+    histogram = merge_partials(histograms, [TrafficColumn.DELAY.value]).sort_values(TrafficColumn.DELAY.value)
+    stats = segment_stats(
+        histogram[TrafficColumn.DELAY.value].to_numpy(np.float64),
+        np.zeros(1, dtype=np.int64),
+        histogram[COUNT].to_numpy(np.int64)
+    )
+    return metric_frame(stats).iloc[0].rename(None)
+
+
+def traffic_group_stats(
+        by: List[str],
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        vehicle_types: Optional[List[str]] = None,
+        routes: Optional[List[str]] = None
+) -> pd.DataFrame:
+    # Straight from the traffic store, for periods whose records or cube do not fit in memory,
+    # timestamps are floored to the hour and the day type is derived per chunk like in the cube
+    def chunks():
+        for chunk in iter_traffic_data(start, end, vehicle_types, routes):
+            timestamp = chunk[TrafficColumn.TIMESTAMP.value].dt.floor("h")
+            yield chunk.assign(**{
+                TrafficColumn.TIMESTAMP.value: timestamp,
+                TrafficColumn.DAY_TYPE.value: day_type(timestamp),
+            })
+
+    return chunked_group_stats(chunks(), by)
@@ -0,0 +1,61 @@
+import os
+
+import pandas as pd
+
+from util import Metric, TrafficColumn, WeatherColumn, load_weather_data
+from util.cube import COUNT, load_cube, rollup
+from util.instrument import timed
+
+FEATURES_PATH = "data/weather/weather-features.parquet"
+
+
+def build_features(cube: pd.DataFrame, weather_df: pd.DataFrame) -> pd.DataFrame:
+    # One row per weather measurement and vehicle type with the delay statistics of its hour, hours without traffic
+    # keep a single empty row. Opóźnienie holds the mean delay and count the delays it averages, so means weighted by
+    # count come out the same as over the records
+    stats = (rollup(cube, [TrafficColumn.TIMESTAMP.value, TrafficColumn.TYPE.value])
+             .rename(columns={Metric.MEAN.value: TrafficColumn.DELAY.value, Metric.COUNT.value: COUNT}))
+    weather_df = weather_df.assign(**{
+        WeatherColumn.TIMESTAMP.value: pd.to_datetime(weather_df[WeatherColumn.TIMESTAMP.value]),
+    })
+    return weather_df.merge(
+        stats,
+        left_on=WeatherColumn.TIMESTAMP.value,
+        right_on=TrafficColumn.TIMESTAMP.value,
+        how="left"
+    )
+
+
+@timed("write_features")
+def write_features(path: str = FEATURES_PATH) -> None:
+    build_features(load_cube(), load_weather_data()).to_parquet(path, index=False, compression="zstd")
+
+
+def load_features(path: str = FEATURES_PATH) -> pd.DataFrame:
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    return build_features(load_cube(), load_weather_data())
+
+
+def weighted_mean(features: pd.DataFrame, column: str) -> float:
+    valid = features[features[column].notna() & features[COUNT].notna()]
+    return (valid[column] * valid[COUNT]).sum() / valid[COUNT].sum()
+
+
+def weighted_group_mean(features: pd.DataFrame, by: str, column: str) -> pd.Series:
+    valid = features[features[column].notna() & features[COUNT].notna()]
+    totals = (valid[column] * valid[COUNT]).groupby(valid[by], observed=True).sum()
+    counts = valid[COUNT].groupby(valid[by], observed=True).sum()
+    return (totals / counts).rename(column)
+
+
+def weather_delay_stats(cube: pd.DataFrame, weather_df: pd.DataFrame) -> pd.DataFrame:
+    # Weather measurements joined with the delay statistics of their hour over all vehicle types, measurements
+    # without traffic get NaN. Quantiles of several types don't follow from theirs, so they come from the cube
+    stats = rollup(cube, [TrafficColumn.TIMESTAMP.value])
+    return weather_df.merge(
+        stats,
+        left_on=WeatherColumn.TIMESTAMP.value,
+        right_on=TrafficColumn.TIMESTAMP.value,
+        how="left"
+    ).reset_index(drop=True)
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import ContextDecorator
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then left out
+    resource = None
+
+LOG_PATH = os.getenv("PAD_PROFILE_LOG", "data/profile.jsonl")
+
+_enabled = os.getenv("PAD_PROFILE", "") not in ("", "0")
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True) -> None:
+    global _enabled
+    _enabled = on
+
+
+def _stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack, _local.records = [], []
+    return _local.stack
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def _log(record: dict) -> None:
+    with _log_lock:
+        os.makedirs(os.path.dirname(LOG_PATH) or ".", exist_ok=True)
+        with open(LOG_PATH, "a") as file:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class timed(ContextDecorator):
+    # Context manager and decorator, a no-op apart from one flag check while profiling is off
+    def __init__(self, name: str):
+        self.name = name
+        self.active = False
+
+    def _recreate_cm(self):
+        # Every decorated call gets its own timer, so recursion and threads do not share state
+        return timed(self.name)
+
+    def __enter__(self):
+        if _enabled:
+            self.active = True
+            self.rows = 0
+            _stack().append(self)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if not self.active:
+            return False
+        seconds = time.perf_counter() - self.start
+        stack = _stack()
+        stack.pop()
+        record = {
+            "section": "/".join([timer.name for timer in stack] + [self.name]),
+            "seconds": round(seconds, 6),
+            "rows": self.rows,
+            "peak_rss_mb": peak_rss_mb(),
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "pid": os.getpid(),
+        }
+        if exc[0] is not None:
+            record["error"] = exc[0].__name__
+        _local.records.append(record)
+        _log(record)
+        return False
+
+
+def count(rows: int) -> None:
+    # Rows processed are credited to the innermost running section
+    if _enabled:
+        stack = _stack()
+        if stack:
+            stack[-1].rows += int(rows)
+
+
+def start_run() -> None:
+    # Forgets the sections of the previous run of this thread, e.g. the last dashboard rerun
+    _stack()
+    _local.records = []
+    _local.run_start = time.perf_counter()
+
+
+def run_seconds() -> float:
+    return time.perf_counter() - getattr(_local, "run_start", time.perf_counter())
+
+
+def records() -> List[dict]:
+    _stack()
+    return list(_local.records)
+
+
+def counted(chunks: Iterable) -> Iterator:
+    # Passes chunks through, crediting their rows to the section that consumes them
+    for chunk in chunks:
+        count(len(chunk))
+        yield chunk
+
+
+def summary(run_records: Optional[List[dict]] = None) -> str:
+    lines = [f"{'section':<50} {'seconds':>9} {'rows':>12} {'peak MB':>9}"]
+    for record in run_records if run_records is not None else records():
+        peak = record["peak_rss_mb"]
+        lines.append(f"{record['section']:<50} {record['seconds']:9.2f} {record['rows']:12d} "
+                     f"{peak if peak is not None else float('nan'):9.1f}")
+    return "\n".join(lines)
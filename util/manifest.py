@@ -0,0 +1,27 @@
+import json
+import os
+from typing import Dict, List, Tuple
+
+
+def load_manifest(path: str) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_manifest(path: str, manifest: Dict[str, dict]) -> None:
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def file_entry(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def changed_files(paths: List[str], manifest: Dict[str, dict]) -> Tuple[List[str], List[str]]:
+    new = [path for path in paths if path not in manifest]
+    modified = [path for path in paths if path in manifest and manifest[path] != file_entry(path)]
+    return new, modified
@@ -1,9 +1,34 @@
+import glob
 import os
+import shutil
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import List
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from util import rename_traffic
+from util.instrument import count, timed
+from util.manifest import changed_files, file_entry, load_manifest, save_manifest
+from util.sketch import ALPHA, SKETCH_PATH, build_sketch, load_sketch, update_sketch, write_sketch
+from util.storage import traffic_types
+
+TRAFFIC_DIR = "data/traffic"
+MERGED_PATH = "data/traffic/delays-merged.csv"
+MANIFEST_PATH = "data/traffic/.merge-manifest.json"
+HASHES_DIR = "data/traffic/.merge-hashes"
+# Hashes of the days a run changed wait here until its manifest is saved
+STAGED_HASHES_DIR = os.path.join(HASHES_DIR, "staged")
+# Manifest key holding the size of the merged file before a run appended to it, removed once the run finishes
+PENDING_OFFSET = ".pending-offset"
+# Days whose hashes are held in memory, the least recently used ones are staged on disk
+SEEN_DAYS = 8
+START_DATE = datetime(2024, 12, 8, 0, 0)
+DEFAULT_MEMORY_BUDGET = 512 * 1024 ** 2
+
 
 def _file_paths(base_dir: str, start_date: datetime, end_date: datetime) -> List[str]:
     paths = []
@@ -14,32 +39,214 @@ def _file_paths(base_dir: str, start_date: datetime, end_date: datetime) -> List
     return list(filter(os.path.exists, paths))
 
 
-def _normalize_brigade(brigade: str) -> str:
-    return str(int(float(brigade))) if brigade.isdigit() or brigade.replace(".0", "").isdigit() else brigade
+def _latest_hour(base_dir: str) -> Optional[datetime]:
+    # Hourly files are laid out as YYYY/MM/DD/delays-HH.csv, so the greatest path is the latest hour
+    paths = glob.glob(os.path.join(base_dir, "[0-9]" * 4, "[0-9]" * 2, "[0-9]" * 2, "delays-[0-9][0-9].csv"))
+    if not paths:
+        return None
+    return datetime.strptime(os.path.relpath(max(paths), base_dir), os.path.join("%Y", "%m", "%d", "delays-%H.csv"))
+
+
+def _normalize_brigade(brigade: pd.Series) -> pd.Series:
+    brigade = brigade.astype(str)
+    numeric = brigade.str.isdigit() | brigade.str.replace(".0", "", regex=False).str.isdigit()
+    # Past 15 digits a float64 no longer holds every integer and int64 overflows, those rare values go row by row
+    long = numeric & (brigade.str.len() > 15)
+    short = numeric & ~long
+    return brigade.mask(numeric, pd.concat([
+        brigade[short].astype(float).astype(np.int64).astype(str),
+        brigade[long].map(lambda value: str(int(float(value)))),
+    ]))
+
+
+def _normalize_delay(delay: pd.Series) -> pd.Series:
+    parts = delay.str.extract(r"^\s*(?P<minutes>\S+)(?P<early>.*przed czasem)?")
+    minutes = parts["minutes"].astype(np.int64)
+    return minutes.where(parts["early"].isna(), -minutes)
+
+
+def _normalize_outside(outside: pd.Series) -> pd.Series:
+    return outside.notna()
+
+
+def _on_uniques(normalize: Callable[[pd.Series], pd.Series], values: pd.Series) -> pd.Series:
+    # Brigades and delay strings repeat a lot, so each distinct value is parsed once
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return pd.Series(normalize(pd.Series(uniques, dtype=object)).to_numpy()[codes], index=values.index)
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df["Brigade"] = _on_uniques(_normalize_brigade, df["Brigade"])
+    df["Delay"] = _on_uniques(_normalize_delay, df["Delay"])
+    df["Outside"] = _normalize_outside(df["Outside"])
+    return df
+
+
+def _days(timestamps: pd.Series) -> np.ndarray:
+    codes, uniques = pd.factorize(timestamps, use_na_sentinel=False)
+    return np.asarray(pd.to_datetime(uniques).strftime("%Y-%m-%d"), dtype=str)[codes]
+
+
+def _parse_file(path: str, columns: pd.Index) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    # Raw values are kept as text, so every file parses the same way regardless of what the others contain
+    df = pd.read_csv(path, dtype=str).reindex(columns=columns)
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    days = _days(df["Timestamp"])
+    return traffic_types(_normalize(df)), hashes, days
+
+
+def _parsed_files(
+        paths: List[str],
+        columns: pd.Index,
+        workers: int
+) -> Iterator[Tuple[pd.DataFrame, np.ndarray, np.ndarray]]:
+    if workers <= 1:
+        for path in paths:
+            yield _parse_file(path, columns)
+        return
+    # Results come back in path order, with a bounded number of files parsed ahead of the writer
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(_parse_file, path, columns))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _load_seen(seen: Dict[str, np.ndarray], days: pd.Index) -> None:
+    for day in days:
+        if day in seen:
+            # Most recently used days are kept at the end
+            seen[day] = seen.pop(day)
+            continue
+        paths = [os.path.join(directory, f"{day}.npy") for directory in (STAGED_HASHES_DIR, HASHES_DIR)]
+        path = next(filter(os.path.exists, paths), None)
+        seen[day] = np.load(path) if path else np.empty(0, dtype=np.uint64)
+
+
+def _keep_new(hashes: np.ndarray, days: np.ndarray, seen: Dict[str, np.ndarray]) -> np.ndarray:
+    # Duplicates share a timestamp, so each row is only checked against the hashes kept for its day
+    day_codes, day_values = pd.factorize(days)
+    _load_seen(seen, day_values)
+    keep = ~pd.Series(hashes).duplicated().to_numpy()
+    for code, day in enumerate(day_values):
+        in_day = day_codes == code
+        known = seen[day]
+        if len(known):
+            idx = np.searchsorted(known, hashes[in_day]).clip(max=len(known) - 1)
+            keep[in_day] &= known[idx] != hashes[in_day]
+        added = np.sort(hashes[in_day & keep])
+        seen[day] = np.insert(known, np.searchsorted(known, added), added)
+    _stage_seen(seen, SEEN_DAYS)
+    return keep
+
+
+def _stage_seen(seen: Dict[str, np.ndarray], keep: int = 0) -> None:
+    os.makedirs(STAGED_HASHES_DIR, exist_ok=True)
+    while len(seen) > keep:
+        day = next(iter(seen))
+        np.save(os.path.join(STAGED_HASHES_DIR, f"{day}.npy"), seen.pop(day))
+
 
+def _commit_seen() -> None:
+    # Runs once the manifest is saved, if it's cut short the next run moves the remaining files
+    if not os.path.isdir(STAGED_HASHES_DIR):
+        return
+    for name in os.listdir(STAGED_HASHES_DIR):
+        os.replace(os.path.join(STAGED_HASHES_DIR, name), os.path.join(HASHES_DIR, name))
+    os.rmdir(STAGED_HASHES_DIR)
 
-def _normalize_delay(delay: str) -> int:
-    return -int(delay.split()[0]) if "przed czasem" in delay else int(delay.split()[0])
 
+def _recover(manifest: Dict[str, dict]) -> Dict[str, dict]:
+    # A run that stopped before saving its manifest may have appended part of its rows and staged their hashes,
+    # the merged file is cut back to where that run started and its files count as new again
+    if PENDING_OFFSET in manifest:
+        print("The last traffic merge didn't finish, dropping the rows it appended", file=sys.stderr)
+        with open(MERGED_PATH, "r+b") as file:
+            file.truncate(manifest.pop(PENDING_OFFSET))
+        shutil.rmtree(STAGED_HASHES_DIR, ignore_errors=True)
+        # The sketch may already count those rows
+        if os.path.exists(SKETCH_PATH):
+            os.remove(SKETCH_PATH)
+        save_manifest(MANIFEST_PATH, manifest)
+    _commit_seen()
+    return manifest
 
-def _normalize_outside(outside) -> bool:
-    return pd.notna(outside)
 
+def _batches(
+        paths: List[str],
+        columns: pd.Index,
+        seen: Dict[str, np.ndarray],
+        memory_budget: int,
+        workers: int
+) -> Iterator[pd.DataFrame]:
+    batch, batch_size = [], 0
+    for df, hashes, days in _parsed_files(paths, columns, workers):
+        df = df[_keep_new(hashes, days, seen)]
+        batch.append(df)
+        batch_size += df.memory_usage(index=False, deep=True).sum()
+        if batch_size >= memory_budget:
+            yield traffic_types(pd.concat(batch, ignore_index=True))
+            batch, batch_size = [], 0
+    if batch:
+        yield traffic_types(pd.concat(batch, ignore_index=True))
 
-def merge_traffic():
-    paths = _file_paths(
-        "data/traffic",
-        datetime(2024, 12, 8, 0, 0),
-        datetime(2025, 1, 2, 23)
-    )
 
-    df = pd.read_csv(paths[0])
-    for path in paths[1:]:
-        df = pd.concat([df, pd.read_csv(path)])
-    df.drop_duplicates(inplace=True)
+@timed("merge_traffic")
+def merge_traffic(
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        sketch_alpha: Optional[float] = None,
+        incremental: bool = False,
+        start_date: datetime = START_DATE,
+        end_date: Optional[datetime] = None,
+        workers: int = 1
+) -> Optional[int]:
+    # Byte offset of the rows this run appended to the merged file, 0 after a full merge, None if nothing was new.
+    # Without end_date every hour up to the latest downloaded file is merged
+    end_date = end_date or _latest_hour(TRAFFIC_DIR)
+    paths = _file_paths(TRAFFIC_DIR, start_date, end_date) if end_date else []
 
-    df["Brigade"] = df["Brigade"].astype(str).apply(_normalize_brigade)
-    df["Delay"] = df["Delay"].apply(_normalize_delay)
-    df["Outside"] = df["Outside"].apply(_normalize_outside)
+    manifest = _recover(load_manifest(MANIFEST_PATH)) if incremental and os.path.exists(MERGED_PATH) else {}
+    new, modified = changed_files(paths, manifest)
+    if modified:
+        # Rows from a rewritten file can't be taken back out of the merged file
+        print(f"{len(modified)} merged files changed, rebuilding", file=sys.stderr)
+        manifest, new = {}, paths
+    if not new:
+        print("Traffic is up to date", file=sys.stderr)
+        return None
+    if not manifest:
+        shutil.rmtree(HASHES_DIR, ignore_errors=True)
+    print(f"Merging {len(new)} traffic files with {workers} workers", file=sys.stderr)
 
-    df.to_csv("data/traffic/delays-merged.csv", index=False)
+    # Rows are deduplicated by a 64-bit hash of their raw values, kept in sorted per-day arrays
+    seen = {}
+    columns = pd.read_csv(MERGED_PATH if manifest else new[0], dtype=str, nrows=0).columns
+    sketch_df = load_sketch() if manifest and sketch_alpha and os.path.exists(SKETCH_PATH) else None
+    if sketch_alpha and manifest and (sketch_df is None or sketch_df.attrs.get(ALPHA) != sketch_alpha):
+        # Counts of the rows merged before can't be recovered, only a full merge builds the sketch again
+        print(f"No sketch of the merged rows with alpha {sketch_alpha}, skipping it until a full merge",
+              file=sys.stderr)
+        sketch_alpha, sketch_df = None, None
+    offset = os.path.getsize(MERGED_PATH) if manifest else 0
+    # Saved before anything is appended, so whatever happens until the manifest is saved again can be undone
+    save_manifest(MANIFEST_PATH, {**manifest, PENDING_OFFSET: offset})
+    with open(MERGED_PATH, "a" if manifest else "w", newline="") as file:
+        for i, batch in enumerate(_batches(new, columns, seen, memory_budget, workers)):
+            batch.to_csv(file, header=i == 0 and not manifest, index=False)
+            count(len(batch))
+            if sketch_alpha:
+                # Only the days of the batch are merged into the running sketch, the earlier days are left as they are
+                batch_sketch = build_sketch(rename_traffic(batch), sketch_alpha)
+                sketch_df = batch_sketch if sketch_df is None else update_sketch(sketch_df, batch_sketch)
+    _stage_seen(seen)
+    if sketch_df is not None:
+        write_sketch(sketch_df)
+    save_manifest(MANIFEST_PATH, {**manifest, **{path: file_entry(path) for path in new}})
+    _commit_seen()
+    if manifest and os.path.getsize(MERGED_PATH) == offset:
+        print("New traffic files only had rows merged before", file=sys.stderr)
+        return None
+    return offset
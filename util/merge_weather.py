@@ -1,18 +1,22 @@
 import glob
 import os
+import sys
 
+import numpy as np
 import pandas as pd
 
+from util.instrument import count, timed
+from util.manifest import changed_files, file_entry, load_manifest, save_manifest
+from util.storage import WEATHER_MEASUREMENTS
 
-def merge_weather():
-    path = "data/weather/"
+WEATHER_DIR = "data/weather/"
+MERGED_PATH = "data/weather/weather-merged.csv"
+MANIFEST_PATH = "data/weather/.merge-manifest.json"
+# Sorted hashes of the merged rows, so appending doesn't need the merged file read back
+HASHES_PATH = "data/weather/.merge-hashes.npy"
 
-    all_files = glob.glob(os.path.join(path, "**", "*.csv"), recursive=True)
-
-    df_from_each_file = [pd.read_csv(f) for f in all_files]
-
-    weather = pd.concat(df_from_each_file, ignore_index=True) if df_from_each_file else pd.DataFrame()
 
+def _prepare(weather: pd.DataFrame) -> pd.DataFrame:
     weather["data_pomiaru"] = pd.to_datetime(weather["data_pomiaru"])
     weather["godzina_pomiaru"] = weather["godzina_pomiaru"].astype(str).str.zfill(2) + ":00:00"
     weather.dropna(subset=["data_pomiaru", "godzina_pomiaru"], inplace=True)
@@ -20,11 +24,64 @@ def merge_weather():
 
     weather.drop(columns=["data_pomiaru", "godzina_pomiaru"], inplace=True)
 
-    weather["temperatura"] = pd.to_numeric(weather["temperatura"], errors="coerce")
-    weather["predkosc_wiatru"] = pd.to_numeric(weather["predkosc_wiatru"], errors="coerce")
-    weather["wilgotnosc_wzgledna"] = pd.to_numeric(weather["wilgotnosc_wzgledna"], errors="coerce")
-    weather["suma_opadu"] = pd.to_numeric(weather["suma_opadu"], errors="coerce")
-    weather["cisnienie"] = pd.to_numeric(weather["cisnienie"], errors="coerce")
+    for column in WEATHER_MEASUREMENTS:
+        weather[column] = pd.to_numeric(weather[column], errors="coerce")
 
     weather.drop_duplicates(inplace=True)
-    weather.to_csv("data/weather/weather-merged.csv", index=False)
+    return weather
+
+
+def _comparable(column: pd.Series) -> pd.Series:
+    # Files write the same number as 180 or 180.0, numbers are compared as floats and everything else as text
+    numeric = pd.to_numeric(column, errors="coerce").astype("float64")
+    return numeric.astype(str).where(numeric.notna(), column.astype(str))
+
+
+def _row_hashes(weather: pd.DataFrame) -> np.ndarray:
+    comparable = weather.apply(lambda column: column if column.name == "timestamp" else _comparable(column))
+    return pd.util.hash_pandas_object(comparable, index=False).to_numpy()
+
+
+def _merged_hashes() -> np.ndarray:
+    if os.path.exists(HASHES_PATH):
+        return np.load(HASHES_PATH)
+    # Merged by an older version, the merged rows are hashed once
+    return np.unique(_row_hashes(pd.read_csv(MERGED_PATH, parse_dates=["timestamp"])))
+
+
+@timed("merge_weather")
+def merge_weather(incremental: bool = False) -> bool:
+    # Whether the merged file changed
+    all_files = [
+        f for f in glob.glob(os.path.join(WEATHER_DIR, "**", "*.csv"), recursive=True)
+        if os.path.abspath(f) != os.path.abspath(MERGED_PATH)
+    ]
+
+    manifest = load_manifest(MANIFEST_PATH) if incremental and os.path.exists(MERGED_PATH) else {}
+    new, modified = changed_files(all_files, manifest)
+    if modified:
+        print(f"{len(modified)} merged files changed, rebuilding", file=sys.stderr)
+        manifest, new = {}, all_files
+    if not new:
+        print("Weather is up to date", file=sys.stderr)
+        return False
+
+    df_from_each_file = [pd.read_csv(f) for f in new]
+
+    weather = pd.concat(df_from_each_file, ignore_index=True) if df_from_each_file else pd.DataFrame()
+    weather = _prepare(weather)
+    count(len(weather))
+
+    if manifest:
+        merged_hashes = _merged_hashes()
+        weather = weather.reindex(columns=pd.read_csv(MERGED_PATH, nrows=0).columns)
+        hashes = _row_hashes(weather)
+        new_rows = ~np.isin(hashes, merged_hashes)
+        weather[new_rows].to_csv(MERGED_PATH, mode="a", header=False, index=False)
+        merged_hashes = np.union1d(merged_hashes, hashes[new_rows])
+    else:
+        weather.to_csv(MERGED_PATH, index=False)
+        merged_hashes = np.unique(_row_hashes(weather))
+    np.save(HASHES_PATH, merged_hashes)
+    save_manifest(MANIFEST_PATH, {**manifest, **{path: file_entry(path) for path in new}})
+    return True
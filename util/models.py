@@ -0,0 +1,171 @@
+from functools import partial
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from util import Metric, TrafficColumn, WeatherColumn, load_weather_data
+from util.cube import COUNT, load_cube, rollup
+from util.instrument import count, timed
+from util.registry import data_hash, load_or_fit
+
+# Bumped whenever the fitting changes, so that models in the registry are fitted again
+VERSION = 1
+GLOBAL_MODELS = "global-models"
+CATEGORY_MODELS = "category-models"
+CATEGORIES = [TrafficColumn.VEHICLE_NO.value, TrafficColumn.BRIGADE.value, TrafficColumn.ROUTE.value]
+TARGETS = [Metric.MEAN.value, Metric.COUNT.value]
+INPUTS = [
+    WeatherColumn.TEMPERATURE.value,
+    WeatherColumn.WIND_SPEED.value,
+    WeatherColumn.HUMIDITY.value,
+    WeatherColumn.RAINFALL.value,
+    WeatherColumn.PRESSURE.value,
+]
+CATEGORY = "category"
+METRIC = "metric"
+VALUE = "value"
+INTERCEPT = "intercept"
+ROWS = "rows"
+R2 = "r2"
+
+# Directions of the input covariance this small relative to its trace are treated as constant
+_TOLERANCE = 1e-10
+
+
+def _hours(cube: pd.DataFrame, weather_df: pd.DataFrame) -> pd.DataFrame:
+    # Weather measurements with the delay metrics of their hour, like the rows the dashboard regression is fitted on
+    stats = rollup(cube, [TrafficColumn.TIMESTAMP.value])[[TrafficColumn.TIMESTAMP.value] + TARGETS]
+    weather_df = weather_df.assign(**{
+        WeatherColumn.TIMESTAMP.value: pd.to_datetime(weather_df[WeatherColumn.TIMESTAMP.value])
+    })
+    hours = weather_df.merge(
+        stats,
+        left_on=WeatherColumn.TIMESTAMP.value,
+        right_on=TrafficColumn.TIMESTAMP.value,
+        how="inner"
+    )
+    return hours.dropna(subset=INPUTS).reset_index(drop=True)
+
+
+def _moments(hours: pd.DataFrame) -> Tuple[pd.Index, np.ndarray, np.ndarray, np.ndarray]:
+    # Per-hour sums of 1, z, z z^T, y, z y and y^2 over the weather rows of the hour,
+    # z are the inputs standardized over all hours so that centering later loses no precision
+    x = hours[INPUTS].to_numpy(np.float64)
+    shift = x.mean(axis=0)
+    scale = x.std(axis=0)
+    scale[scale == 0] = 1
+    z = (x - shift) / scale
+    y = hours[TARGETS].to_numpy(np.float64)
+    codes, unique_hours = pd.factorize(hours[TrafficColumn.TIMESTAMP.value])
+    columns = np.concatenate([
+        np.ones((len(z), 1)),
+        z,
+        (z[:, :, None] * z[:, None, :]).reshape(len(z), -1),
+        y,
+        (z[:, :, None] * y[:, None, :]).reshape(len(z), -1),
+        y * y,
+    ], axis=1)
+    per_hour = np.zeros((len(unique_hours), columns.shape[1]))
+    np.add.at(per_hour, codes, columns)
+    return pd.Index(unique_hours), per_hour, shift, scale
+
+
+def _solve(sums: np.ndarray, shift: np.ndarray, scale: np.ndarray) -> Dict[str, np.ndarray]:
+    k, t = len(INPUTS), len(TARGETS)
+    n = sums[:, 0]
+    parts = np.split(sums[:, 1:], np.cumsum([k, k * k, t, k * t]), axis=1)
+    sz, szz, sy, szy, syy = parts[0], parts[1].reshape(-1, k, k), parts[2], parts[3].reshape(-1, k, t), parts[4]
+    mz, my = sz / n[:, None], sy / n[:, None]
+    # Centered normal equations, solved through the eigenbasis so that constant inputs get a zero coefficient,
+    # the minimum-norm solution least squares picks as well
+    czz = szz - n[:, None, None] * mz[:, :, None] * mz[:, None, :]
+    czy = szy - n[:, None, None] * mz[:, :, None] * my[:, None, :]
+    cyy = syy - n[:, None] * my * my
+    eigenvalues, eigenvectors = np.linalg.eigh(czz)
+    keep = eigenvalues > _TOLERANCE * np.trace(szz, axis1=1, axis2=2)[:, None]
+    inverse = np.where(keep, 1 / np.where(keep, eigenvalues, 1), 0)
+    coef = np.einsum("vij,vj,vkj,vkt->vit", eigenvectors, inverse, eigenvectors, czy)
+    residual = cyy - 2 * np.einsum("vit,vit->vt", coef, czy) + np.einsum("vit,vij,vjt->vt", coef, czz, coef)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = np.where(cyy > 0, 1 - residual / cyy, np.nan)
+    # Back from standardized to raw weather units
+    coef = coef / scale[None, :, None]
+    intercept = my - np.einsum("vit,vi->vt", coef * scale[None, :, None], mz) - np.einsum("vit,i->vt", coef, shift)
+    return {"coef": coef, INTERCEPT: intercept, ROWS: n, R2: r2}
+
+
+def _frame(fit: Dict[str, np.ndarray], category: str, values: List[str]) -> pd.DataFrame:
+    frames = []
+    for t, target in enumerate(TARGETS):
+        frame = pd.DataFrame(fit["coef"][:, :, t], columns=INPUTS)
+        frame.insert(0, INTERCEPT, fit[INTERCEPT][:, t])
+        frame[ROWS] = fit[ROWS].astype(np.int64)
+        frame[R2] = fit[R2][:, t]
+        frame.index = pd.MultiIndex.from_arrays(
+            [np.full(len(values), category), np.full(len(values), target), values],
+            names=[CATEGORY, METRIC, VALUE]
+        )
+        frames.append(frame)
+    return pd.concat(frames)
+
+
+@timed("fit_category_models")
+def fit_category_models(cube: pd.DataFrame, weather_df: pd.DataFrame) -> pd.DataFrame:
+    # One weighted least squares per category value and target, every hour counts as many times as the value
+    # has delay records in it, all values of a category are solved in one batch
+    count(len(cube))
+    unique_hours, per_hour, shift, scale = _moments(_hours(cube, weather_df))
+    frames = []
+    for category in CATEGORIES:
+        counts = cube.groupby([category, TrafficColumn.TIMESTAMP.value], observed=True)[COUNT].sum()
+        hour_codes = unique_hours.get_indexer(counts.index.get_level_values(TrafficColumn.TIMESTAMP.value))
+        valid = (hour_codes >= 0) & (counts.to_numpy() > 0)
+        value_codes, values = pd.factorize(counts.index.get_level_values(category)[valid])
+        weights = counts.to_numpy(np.float64)[valid]
+        hour_codes = hour_codes[valid]
+        # Column by column, a (value, hour) pairs by moments matrix would not fit in memory for long periods
+        sums = np.column_stack([
+            np.bincount(value_codes, weights * per_hour[hour_codes, k], minlength=len(values))
+            for k in range(per_hour.shape[1])
+        ])
+        frames.append(_frame(_solve(sums, shift, scale), category, values.astype(str)))
+    return pd.concat(frames).sort_index()
+
+
+@timed("fit_global_models")
+def fit_global_models(cube: pd.DataFrame, weather_df: pd.DataFrame) -> pd.DataFrame:
+    count(len(cube))
+    # Every weather measurement of an hour with traffic counts once
+    _, per_hour, shift, scale = _moments(_hours(cube, weather_df))
+    return _frame(_solve(per_hour.sum(axis=0, keepdims=True), shift, scale), "", [""]).droplevel([CATEGORY, VALUE])
+
+
+def predict(model: pd.Series, weather_df: pd.DataFrame) -> np.ndarray:
+    return weather_df[INPUTS].to_numpy(np.float64) @ model[INPUTS].to_numpy(np.float64) + model[INTERCEPT]
+
+
+def inputs_hash(cube: pd.DataFrame, weather_df: pd.DataFrame) -> str:
+    # Only what the fits read, other columns changing keeps the models
+    weather_df = weather_df[[WeatherColumn.TIMESTAMP.value] + INPUTS].assign(**{
+        WeatherColumn.TIMESTAMP.value: pd.to_datetime(weather_df[WeatherColumn.TIMESTAMP.value])
+    })
+    cube = cube[[TrafficColumn.TIMESTAMP.value, TrafficColumn.DELAY.value, COUNT] + CATEGORIES]
+    return data_hash(cube, weather_df, salt=f"{VERSION}:{TARGETS}")
+
+
+MODELS = {
+    GLOBAL_MODELS: fit_global_models,
+    CATEGORY_MODELS: fit_category_models,
+}
+
+
+def registered_models(name: str, cube: pd.DataFrame, weather_df: pd.DataFrame) -> pd.DataFrame:
+    return load_or_fit(name, inputs_hash(cube, weather_df), partial(MODELS[name], cube, weather_df))
+
+
+@timed("write_models")
+def write_models() -> None:
+    cube, weather_df = load_cube(), load_weather_data()
+    for name in MODELS:
+        registered_models(name, cube, weather_df)
@@ -0,0 +1,185 @@
+import argparse
+import os
+import re
+import sys
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from util import Metric, TrafficColumn, WeatherColumn, day_type, in_date_range, instrument
+from util.cache import (
+    cube_data, derived_data, model_data, stop_delay_data, table_data, traffic_date_range, weather_data
+)
+from util.cube import COUNT, CUBE_PATH, rollup
+from util.features import weather_delay_stats, weighted_group_mean
+from util.instrument import timed
+from util.models import CATEGORIES, GLOBAL_MODELS, MODELS, TARGETS, predict
+from util.registry import REGISTRY_DIR, REGISTRY_NAME
+from util.stops import STOP_DELAYS_PATH, stop_delays_between
+from util.storage import path_mtime, traffic_mtime, weather_mtime
+
+PRECOMPUTED_DIR = "data/precomputed"
+
+# Options of the dashboards' selectboxes, every combination is written ahead of time
+VEHICLE_TYPES = ["Autobus", "Tramwaj", "Pociąg"]
+TREND_PERIODS: Dict[str, Callable[[pd.Series], pd.Series]] = {
+    "hour": lambda timestamps: timestamps.dt.hour,
+    "day_of_week": lambda timestamps: timestamps.dt.day_name(),
+    "date": lambda timestamps: timestamps.dt.date,
+}
+TRAFFIC_GROUPS = [
+    TrafficColumn.VEHICLE_NO.value,
+    TrafficColumn.BRIGADE.value,
+    TrafficColumn.OUTSIDE.value,
+    TrafficColumn.DAY_TYPE.value,
+]
+WEATHER_PARAMS = [
+    WeatherColumn.TEMPERATURE.value,
+    WeatherColumn.WIND_SPEED.value,
+    WeatherColumn.HUMIDITY.value,
+    WeatherColumn.RAINFALL.value,
+    WeatherColumn.PRESSURE.value,
+]
+WEATHER_METRICS: Dict[str, Callable] = {
+    Metric.MEAN.value: lambda groups: groups.mean(),
+    Metric.MEDIAN.value: lambda groups: groups.median(),
+    Metric.STD_DEV.value: lambda groups: groups.std(),
+    Metric.Q1.value: lambda groups: groups.quantile(0.25),
+    Metric.Q3.value: lambda groups: groups.quantile(0.75),
+}
+
+
+def _cube(start: date, end: date) -> pd.DataFrame:
+    cube = cube_data()
+    return cube[in_date_range(cube[TrafficColumn.TIMESTAMP.value], start, end)]
+
+
+def _weather(start: date, end: date) -> pd.DataFrame:
+    weather_df = weather_data()
+    return weather_df[in_date_range(weather_df[WeatherColumn.TIMESTAMP.value], start, end)]
+
+
+def models_between(name: str, start: date, end: date) -> pd.DataFrame:
+    # Whole period models come from the registry, a narrowed range is fitted once per range
+    if (start, end) == traffic_date_range():
+        return model_data(name)
+    return derived_data(name, (start, end), lambda: MODELS[name](_cube(start, end), _weather(start, end)))
+
+
+def delay_trend(start: date, end: date, vehicle_type: str, period: str) -> pd.DataFrame:
+    # Mean delay of a vehicle type per hour of day, weekday or date, weighted by the record counts of the cube
+    cube = _cube(start, end)
+    cube = cube[cube[TrafficColumn.TYPE.value] == vehicle_type]
+    cube = cube.assign(**{period: TREND_PERIODS[period](cube[TrafficColumn.TIMESTAMP.value])})
+    return weighted_group_mean(cube, period, TrafficColumn.DELAY.value).rename("Delay").reset_index()
+
+
+def stop_map(start: date, end: date, vehicle_type: str) -> pd.DataFrame:
+    stop_delays = stop_delays_between(stop_delay_data(), start, end)
+    return stop_delays.loc[
+        stop_delays["Type"] == vehicle_type, ["stop_name", "stop_lat", "stop_lon", "Delay"]
+    ].reset_index(drop=True)
+
+
+def weather_correlation(start: date, end: date) -> pd.DataFrame:
+    return weather_delay_stats(_cube(start, end), _weather(start, end)).corr()
+
+
+def weather_by_day_type(start: date, end: date, metric: str) -> pd.DataFrame:
+    weather_df = _weather(start, end)
+    groups = weather_df[WEATHER_PARAMS].groupby(day_type(weather_df[WeatherColumn.TIMESTAMP.value]), observed=True)
+    return WEATHER_METRICS[metric](groups).rename_axis(WeatherColumn.DAY_TYPE.value).reset_index()
+
+
+def day_type_delays(start: date, end: date) -> pd.DataFrame:
+    return rollup(_cube(start, end), [TrafficColumn.DAY_TYPE.value])
+
+
+def category_stats(start: date, end: date, group: str) -> pd.DataFrame:
+    return rollup(_cube(start, end), [group])
+
+
+def hourly_delay_stats(start: date, end: date) -> pd.DataFrame:
+    # Weather measurements with the delay statistics of their hour, only hours that had traffic
+    weather_stats = weather_delay_stats(_cube(start, end), _weather(start, end))
+    return weather_stats[weather_stats[TrafficColumn.TIMESTAMP.value].notna()].reset_index(drop=True)
+
+
+def global_predictions(start: date, end: date, metric: str) -> pd.DataFrame:
+    weather_stats = dataset("hourly_delay_stats", start, end)
+    return pd.DataFrame({
+        "Timestamp": weather_stats[WeatherColumn.TIMESTAMP.value],
+        "Stan faktyczny": weather_stats[metric],
+        "Prognoza": predict(models_between(GLOBAL_MODELS, start, end).loc[metric], weather_stats),
+    })
+
+
+def category_hours(start: date, end: date, category: str) -> pd.DataFrame:
+    # Delay records of every category value per hour, what the per-value predictions are repeated by
+    cube = _cube(start, end)
+    hours = cube.groupby([category, TrafficColumn.TIMESTAMP.value], observed=True)[COUNT].sum().reset_index()
+    return hours[hours[COUNT] > 0].reset_index(drop=True)
+
+
+DATASETS: Dict[str, Tuple[Callable[..., pd.DataFrame], List[tuple]]] = {
+    "delay_trend": (delay_trend, [(t, p) for t in VEHICLE_TYPES for p in TREND_PERIODS]),
+    "stop_map": (stop_map, [(t,) for t in VEHICLE_TYPES]),
+    "weather_correlation": (weather_correlation, [()]),
+    "weather_by_day_type": (weather_by_day_type, [(m,) for m in WEATHER_METRICS]),
+    "day_type_delays": (day_type_delays, [()]),
+    "category_stats": (category_stats, [(g,) for g in TRAFFIC_GROUPS]),
+    "hourly_delay_stats": (hourly_delay_stats, [()]),
+    "global_predictions": (global_predictions, [(m,) for m in TARGETS]),
+    "category_hours": (category_hours, [(c,) for c in CATEGORIES]),
+}
+
+
+def dataset_path(name: str, params: tuple = ()) -> str:
+    # Parameters are readable in the file name, e.g. delay_trend-Autobus-hour.parquet
+    return os.path.join(PRECOMPUTED_DIR, "-".join([name] + [re.sub(r"\W+", "_", str(p)) for p in params]) + ".parquet")
+
+
+def _sources_mtime() -> float:
+    return max(
+        traffic_mtime(),
+        weather_mtime(),
+        path_mtime(CUBE_PATH, STOP_DELAYS_PATH, os.path.join(REGISTRY_DIR, REGISTRY_NAME))
+    )
+
+
+def dataset(name: str, start: date, end: date, *params) -> pd.DataFrame:
+    # Whole period tables written ahead of time are only read, anything else is built and kept in the cache
+    path = dataset_path(name, params)
+    if (start, end) == traffic_date_range() and path_mtime(path) >= _sources_mtime():
+        return table_data(path)
+    build = DATASETS[name][0]
+    return derived_data(name, (start, end, *params), lambda: build(start, end, *params))
+
+
+@timed("write_precomputed")
+def write_precomputed(names: Optional[List[str]] = None) -> None:
+    os.makedirs(PRECOMPUTED_DIR, exist_ok=True)
+    start, end = traffic_date_range()
+    for name in names or DATASETS:
+        build, grid = DATASETS[name]
+        for params in grid:
+            path = dataset_path(name, params)
+            with timed(os.path.basename(path)):
+                build(start, end, *params).to_parquet(path, compression="zstd")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes the dashboards' datasets for the whole period")
+    parser.add_argument("--datasets", nargs="*", choices=list(DATASETS), help="all of them by default")
+    parser.add_argument("--profile", action="store_true", help=f"time every dataset into {instrument.LOG_PATH}")
+    args = parser.parse_args()
+    if args.profile:
+        instrument.enable()
+    write_precomputed(args.datasets)
+    if instrument.enabled():
+        print(instrument.summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
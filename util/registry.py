@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Callable, Optional
+
+import pandas as pd
+
+from util.manifest import load_manifest, save_manifest
+
+REGISTRY_DIR = "data/models"
+REGISTRY_NAME = "registry.json"
+
+
+def data_hash(*frames: pd.DataFrame, salt: str = "") -> str:
+    digest = hashlib.sha256(salt.encode())
+    for frame in frames:
+        digest.update(json.dumps([str(column) for column in frame.columns]).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _model_path(name: str, registry_dir: str) -> str:
+    return os.path.join(registry_dir, f"{name}.parquet")
+
+
+def load_model(name: str, inputs_hash: str, registry_dir: str = REGISTRY_DIR) -> Optional[pd.DataFrame]:
+    entry = load_manifest(os.path.join(registry_dir, REGISTRY_NAME)).get(name, {})
+    path = _model_path(name, registry_dir)
+    if entry.get("hash") != inputs_hash or not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def save_model(name: str, model: pd.DataFrame, inputs_hash: str, registry_dir: str = REGISTRY_DIR) -> None:
+    os.makedirs(registry_dir, exist_ok=True)
+    # The entry is dropped while the model is written, an interrupted save makes the next load fit again
+    manifest_path = os.path.join(registry_dir, REGISTRY_NAME)
+    manifest = load_manifest(manifest_path)
+    manifest.pop(name, None)
+    save_manifest(manifest_path, manifest)
+    model.to_parquet(_model_path(name, registry_dir), compression="zstd")
+    manifest[name] = {
+        "hash": inputs_hash,
+        "fitted": datetime.now().isoformat(timespec="seconds"),
+        "rows": len(model),
+    }
+    save_manifest(manifest_path, manifest)
+
+
+def load_or_fit(
+        name: str,
+        inputs_hash: str,
+        fit: Callable[[], pd.DataFrame],
+        registry_dir: str = REGISTRY_DIR
+) -> pd.DataFrame:
+    model = load_model(name, inputs_hash, registry_dir)
+    if model is None:
+        model = fit()
+        save_model(name, model, inputs_hash, registry_dir)
+    return model
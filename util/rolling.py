@@ -0,0 +1,148 @@
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from util import TrafficColumn, in_date_range, load_traffic_data, metric_frame
+from util.cache import cube_data
+from util.cube import COUNT, rollup
+from util.instrument import count, timed
+from util.stats import STATS, moments, segment_starts
+
+# Cells of the (group, delay) by bucket count matrix held at once, more groups are processed in batches
+MAX_CELLS = 4_000_000
+
+
+def delay_histogram(df: pd.DataFrame, freq: str, by: Optional[List[str]] = None) -> pd.DataFrame:
+    # Records per group, time bucket and delay, raw records count once and cube cells as many times as they hold
+    by = by or []
+    counts = df[COUNT] if COUNT in df else pd.Series(1, index=df.index, dtype=np.int64)
+    keys = [df[column] for column in by] + [
+        df[TrafficColumn.TIMESTAMP.value].dt.floor(freq),
+        df[TrafficColumn.DELAY.value],
+    ]
+    histogram = counts.groupby(keys, observed=True).sum().rename(COUNT).reset_index()
+    return histogram[histogram[COUNT] > 0].reset_index(drop=True)
+
+
+def route_histogram(start: date, end: date, vehicle_type: str, routes: List[str], freq: str) -> pd.DataFrame:
+    # Whole hours and longer come from the cube, shorter buckets need the raw timestamps of the selected routes
+    if pd.Timedelta(freq) % pd.Timedelta("1h"):
+        df = load_traffic_data(start, end, [vehicle_type], routes)
+    else:
+        df = cube_data()
+        df = df[in_date_range(df[TrafficColumn.TIMESTAMP.value], start, end)
+                & (df[TrafficColumn.TYPE.value] == vehicle_type) & df[TrafficColumn.ROUTE.value].isin(routes)]
+    return delay_histogram(df, freq, [TrafficColumn.ROUTE.value])
+
+
+def bucket_stats(histogram: pd.DataFrame, by: Optional[List[str]] = None) -> pd.DataFrame:
+    return rollup(histogram, (by or []) + [TrafficColumn.TIMESTAMP.value])
+
+
+def _window_stats(
+        counts: np.ndarray,
+        values: np.ndarray,
+        starts: np.ndarray,
+        steps: int
+) -> Dict[str, np.ndarray]:
+    # counts holds one row per (group, delay value) in value order within each group and one column per bucket,
+    # every window is a difference of two running sums, so sliding it by a bucket costs the same for any length
+    running = np.cumsum(counts, axis=1)
+    window = running.copy()
+    window[:, steps:] -= running[:, :-steps]
+    n = np.add.reduceat(window, starts, axis=0)
+    total = np.add.reduceat(window * values[:, None], starts, axis=0)
+    total_sq = np.add.reduceat(window * (values * values)[:, None], starts, axis=0)
+
+    # Records up to and including each value of its group, the value at a rank is the first one above it
+    group_of_row = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(values))))
+    below = np.cumsum(window, axis=0)
+    below -= (below[starts] - window[starts])[group_of_row]
+
+    def at_rank(rank: np.ndarray) -> np.ndarray:
+        position = np.add.reduceat(below <= rank[group_of_row], starts, axis=0)
+        return values[np.minimum(starts[:, None] + position, len(values) - 1)]
+
+    def quantile(q: float) -> np.ndarray:
+        position = q * np.maximum(n - 1, 0)
+        lower, upper = np.floor(position), np.ceil(position)
+        lower_value, upper_value = at_rank(lower), at_rank(upper)
+        return lower_value + (upper_value - lower_value) * (position - lower)
+
+    mean, std_dev = moments(n, total, total_sq)
+    return {
+        "mean": mean,
+        "median": quantile(0.5),
+        "std_dev": std_dev,
+        "q1": quantile(0.25),
+        "q3": quantile(0.75),
+        "count": n,
+    }
+
+
+@timed("rolling_stats")
+def rolling_stats(histogram: pd.DataFrame, freq: str, window: str, by: Optional[List[str]] = None) -> pd.DataFrame:
+    # Delay statistics over the buckets of the last window, one row per group and bucket the window ends with,
+    # exact like rollup, the histogram holds whole minutes
+    by = by or []
+    freq_delta, window_delta = pd.Timedelta(freq), pd.Timedelta(window)
+    if window_delta < freq_delta or window_delta % freq_delta:
+        raise ValueError(f"Window {window} isn't a multiple of the bucket {freq}")
+    steps = window_delta // freq_delta
+    histogram = histogram[histogram[TrafficColumn.DELAY.value].notna() & (histogram[COUNT] > 0)]
+    count(len(histogram))
+    if histogram.empty:
+        return pd.concat(
+            [histogram[by + [TrafficColumn.TIMESTAMP.value]], metric_frame({name: [] for name in STATS})], axis=1
+        )
+
+    timestamps = histogram[TrafficColumn.TIMESTAMP.value].dt.floor(freq)
+    origin = timestamps.min()
+    buckets = ((timestamps - origin) // freq_delta).to_numpy(np.int64)
+    n_buckets = int(buckets.max()) + 1
+    groups = (histogram.groupby(by, observed=True, sort=True).ngroup().to_numpy(np.int64) if by
+              else np.zeros(len(histogram), dtype=np.int64))
+    delays = histogram[TrafficColumn.DELAY.value].to_numpy(np.float64)
+
+    # Rows of the dense matrix are the distinct (group, delay) pairs, sorted by group and then delay
+    order = np.lexsort((delays, groups))
+    groups, delays, buckets = groups[order], delays[order], buckets[order]
+    record_counts = histogram[COUNT].to_numpy(np.int64)[order]
+    new_pair = (np.diff(groups, prepend=-1) != 0) | (np.diff(delays, prepend=np.nan) != 0)
+    pairs = np.cumsum(new_pair) - 1
+    pair_groups, pair_values = groups[new_pair], delays[new_pair]
+    group_starts = segment_starts(pair_groups)
+    group_ends = np.append(group_starts[1:], len(pair_values))
+    group_keys = histogram[by].iloc[order[np.flatnonzero(new_pair)[group_starts]]].reset_index(drop=True)
+
+    frames = []
+    first_group = 0
+    while first_group < len(group_starts):
+        # As many whole groups as fit in MAX_CELLS, at least one
+        first_pair = group_starts[first_group]
+        end_group = max(int(np.searchsorted(group_ends, first_pair + MAX_CELLS // n_buckets, side="right")),
+                        first_group + 1)
+        end_pair = group_ends[end_group - 1]
+        rows = slice(*np.searchsorted(pairs, [first_pair, end_pair]))
+        counts = np.bincount(
+            (pairs[rows] - first_pair) * n_buckets + buckets[rows],
+            record_counts[rows],
+            minlength=(end_pair - first_pair) * n_buckets
+        ).astype(np.int64).reshape(end_pair - first_pair, n_buckets)
+        stats = _window_stats(
+            counts, pair_values[first_pair:end_pair], group_starts[first_group:end_group] - first_pair, steps
+        )
+        group_index, bucket_index = np.nonzero(stats["count"] > 0)
+        frame = pd.concat(
+            [
+                group_keys.iloc[first_group + group_index].reset_index(drop=True),
+                pd.DataFrame({TrafficColumn.TIMESTAMP.value: origin + freq_delta * bucket_index}),
+                metric_frame({name: values[group_index, bucket_index] for name, values in stats.items()}),
+            ],
+            axis=1
+        )
+        frames.append(frame)
+        first_group = end_group
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,97 @@
+from enum import Enum
+from typing import Dict
+
+import pandas as pd
+
+
+class Type(Enum):
+    STRING = "str"
+    DOUBLE = "float64"
+    BOOL = "bool"
+    CATEGORY = "category"
+    INT16 = "int16"
+    INT32 = "int32"
+    DATETIME = "datetime64[ns]"
+
+
+class TrafficColumn(Enum):
+    BRIGADE_OG = "Brigade"
+    BRIGADE = "Brygada"
+    ROUTE_OG = "Route"
+    ROUTE = "Linia"
+    VEHICLE_NO_OG = "Vehicle No"
+    VEHICLE_NO = "Numer pojazdu"
+    DELAY_OG = "Delay"
+    DELAY = "Opóźnienie"
+    OUTSIDE_OG = "Outside"
+    OUTSIDE = "Poza trasą"
+    TYPE_OG = "Type"
+    TYPE = "Typ"
+    STOP_NAME = "Stop Name"
+    TIMESTAMP = "Timestamp"
+    DAY_TYPE = "Typ dnia"
+
+
+class DayType(Enum):
+    WEEKDAY = "Dzień roboczy"
+    WEEKEND = "Weekend"
+    HOLIDAY = "Święto"
+
+
+DAY_TYPES = pd.CategoricalDtype([e.value for e in DayType])
+
+
+class WeatherColumn(Enum):
+    TEMPERATURE_OG = "temperatura"
+    TEMPERATURE = "Temperatura"
+    WIND_SPEED_OG = "predkosc_wiatru"
+    WIND_SPEED = "Prędkość wiatru"
+    HUMIDITY_OG = "wilgotnosc_wzgledna"
+    HUMIDITY = "Wilgotność względna"
+    RAINFALL_OG = "suma_opadu"
+    RAINFALL = "Suma opadu"
+    PRESSURE_OG = "cisnienie"
+    PRESSURE = "Ciśnienie"
+    TIMESTAMP = "timestamp"
+    DAY_TYPE = "Typ dnia"
+
+
+class Metric(Enum):
+    MEAN = "Średnia"
+    MEDIAN = "Mediana"
+    STD_DEV = "Odchylenie standardowe"
+    Q1 = "25 centyl"
+    Q3 = "75 centyl"
+    COUNT = "Ilość"
+
+
+# Keyed by the raw column names, as they appear in the merged files
+TRAFFIC_DTYPES: Dict[str, Type] = {
+    TrafficColumn.TIMESTAMP.value: Type.DATETIME,
+    TrafficColumn.STOP_NAME.value: Type.CATEGORY,
+    TrafficColumn.TYPE_OG.value: Type.CATEGORY,
+    TrafficColumn.ROUTE_OG.value: Type.CATEGORY,
+    TrafficColumn.BRIGADE_OG.value: Type.CATEGORY,
+    TrafficColumn.VEHICLE_NO_OG.value: Type.CATEGORY,
+    TrafficColumn.DELAY_OG.value: Type.INT16,
+    TrafficColumn.OUTSIDE_OG.value: Type.BOOL,
+}
+
+WEATHER_DTYPES: Dict[str, Type] = {
+    WeatherColumn.TIMESTAMP.value: Type.DATETIME,
+    WeatherColumn.TEMPERATURE_OG.value: Type.DOUBLE,
+    WeatherColumn.WIND_SPEED_OG.value: Type.DOUBLE,
+    WeatherColumn.HUMIDITY_OG.value: Type.DOUBLE,
+    WeatherColumn.RAINFALL_OG.value: Type.DOUBLE,
+    WeatherColumn.PRESSURE_OG.value: Type.DOUBLE,
+}
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    report = pd.DataFrame({
+        "before": before.memory_usage(index=False, deep=True),
+        "after": after.memory_usage(index=False, deep=True),
+    })
+    report.loc["total"] = report.sum()
+    report["ratio"] = report["before"] / report["after"]
+    return report
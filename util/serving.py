@@ -0,0 +1,42 @@
+import argparse
+import os
+import sys
+
+from util import instrument
+from util.cube import CUBE_MAPPED, load_cube
+from util.instrument import timed
+from util.storage import TRAFFIC_MAPPED, WEATHER_MAPPED, iter_traffic, read_weather, write_mapped
+
+
+@timed("write_serving_files")
+def write_serving_files() -> None:
+    # Typed traffic, weather and the cube as uncompressed Arrow files, once written every dashboard process maps them
+    # instead of decoding its own copy, readers fall back to the stores while the files are missing or older
+    write_mapped(TRAFFIC_MAPPED, iter_traffic())
+    write_mapped(WEATHER_MAPPED, [read_weather()])
+    write_mapped(CUBE_MAPPED, [load_cube()])
+
+
+def remove_serving_files() -> None:
+    for path in (TRAFFIC_MAPPED, WEATHER_MAPPED, CUBE_MAPPED):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes the memory-mapped files shared by all dashboard processes")
+    parser.add_argument("--remove", action="store_true", help="go back to reading the parquet stores")
+    parser.add_argument("--profile", action="store_true", help=f"time the writes into {instrument.LOG_PATH}")
+    args = parser.parse_args()
+    if args.profile:
+        instrument.enable()
+    if args.remove:
+        remove_serving_files()
+    else:
+        write_serving_files()
+    if instrument.enabled():
+        print(instrument.summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import os
+from datetime import date
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from util import TrafficColumn, concat_frames, day_type, in_date_range, metric_frame
+from util.cube import COUNT
+from util.stats import moments, segment_starts, segment_stats
+from util.storage import DAY
+
+SKETCH_PATH = "data/traffic/delays-sketch.parquet"
+DEFAULT_ALPHA = 0.01
+VALUE = "value"
+SUM = "sum"
+SUM_SQ = "sum_sq"
+# Kept in the frame's attrs, which parquet stores with the file
+ALPHA = "alpha"
+# Days but no hours, vehicles or brigades, so any range of days is covered by summing the days' buckets while
+# the sketch only grows by the routes and delay buckets of every merged day
+SKETCH_DIMENSIONS = [
+    DAY,
+    TrafficColumn.TYPE.value,
+    TrafficColumn.ROUTE.value,
+    TrafficColumn.OUTSIDE.value,
+    TrafficColumn.DAY_TYPE.value,
+]
+
+
+def _representatives(values: np.ndarray, alpha: float) -> np.ndarray:
+    # Log-spaced buckets (DDSketch): every value is replaced by a representative within alpha relative error
+    gamma = (1 + alpha) / (1 - alpha)
+    magnitude = np.abs(values.astype(np.float64))
+    with np.errstate(divide="ignore"):
+        index = np.ceil(np.log(magnitude) / np.log(gamma))
+    return np.where(magnitude > 0, np.sign(values) * 2 * gamma ** index / (gamma + 1), 0.0)
+
+
+def build_sketch(traffic: pd.DataFrame, alpha: float = DEFAULT_ALPHA) -> pd.DataFrame:
+    if not 0 < alpha < 1:
+        raise ValueError(f"Sketch alpha {alpha} isn't between 0 and 1")
+    # Delays are whole minutes, so rows are first counted per delay and only the distinct delays get a bucket
+    timestamps = traffic[TrafficColumn.TIMESTAMP.value]
+    keys = [timestamps.dt.normalize().rename(DAY)] + [traffic[column] for column in SKETCH_DIMENSIONS[1:-1]] + [
+        day_type(timestamps).rename(TrafficColumn.DAY_TYPE.value),
+        traffic[TrafficColumn.DELAY.value],
+    ]
+    counts = traffic.groupby(keys, observed=True, dropna=False).size().rename(COUNT).reset_index()
+    delay = counts.pop(TrafficColumn.DELAY.value).to_numpy(np.float64)
+    sketch_df = counts.assign(**{
+        VALUE: _representatives(delay, alpha),
+        SUM: delay * counts[COUNT],
+        SUM_SQ: delay * delay * counts[COUNT],
+    })
+    sketch_df.attrs[ALPHA] = alpha
+    return merge_sketches([sketch_df])
+
+
+def merge_sketches(sketches: List[pd.DataFrame]) -> pd.DataFrame:
+    alphas = {sketch.attrs[ALPHA] for sketch in sketches if ALPHA in sketch.attrs}
+    if len(alphas) > 1:
+        raise ValueError(f"Sketches with different alphas {sorted(alphas)} can't be merged")
+    sketch_df = concat_frames(sketches)
+    merged = (sketch_df
+              .groupby(SKETCH_DIMENSIONS + [VALUE], observed=True, dropna=False)[[COUNT, SUM, SUM_SQ]]
+              .sum()
+              .reset_index())
+    merged.attrs = {ALPHA: alphas.pop()} if alphas else {}
+    return merged
+
+
+def update_sketch(sketch_df: pd.DataFrame, added: pd.DataFrame) -> pd.DataFrame:
+    # Only the days the added rows fall on are merged again, the others are carried over as they are
+    affected = sketch_df[DAY].isin(added[DAY].unique())
+    merged = merge_sketches([sketch_df[affected], added])
+    updated = concat_frames([sketch_df[~affected], merged])
+    updated.attrs = merged.attrs
+    return updated
+
+
+def write_sketch(sketch_df: pd.DataFrame, path: str = SKETCH_PATH) -> None:
+    for column in SKETCH_DIMENSIONS:
+        if sketch_df[column].dtype == object:
+            sketch_df[column] = sketch_df[column].astype("category")
+    sketch_df.to_parquet(path, index=False, compression="zstd")
+
+
+def load_sketch(path: str = SKETCH_PATH) -> pd.DataFrame:
+    return pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame(
+        columns=SKETCH_DIMENSIONS + [VALUE, COUNT, SUM, SUM_SQ]
+    )
+
+
+def sketch_rollup(
+        sketch_df: pd.DataFrame,
+        by: List[str],
+        start: Optional[date] = None,
+        end: Optional[date] = None
+) -> pd.DataFrame:
+    # Median and quartiles come from the bucket representatives, the remaining metrics from exact sums
+    sketch_df = sketch_df[in_date_range(sketch_df[DAY], start, end)]
+    buckets = sketch_df.groupby(by + [VALUE], observed=True)[[COUNT, SUM, SUM_SQ]].sum().reset_index()
+    buckets = buckets[buckets[COUNT] > 0].reset_index(drop=True)
+    starts = segment_starts(buckets.groupby(by, observed=True, sort=False).ngroup().to_numpy())
+    counts = buckets[COUNT].to_numpy(np.int64)
+    stats = segment_stats(buckets[VALUE].to_numpy(np.float64), starts, counts)
+
+    if len(starts):
+        stats["mean"], stats["std_dev"] = moments(
+            stats["count"],
+            np.add.reduceat(buckets[SUM].to_numpy(np.float64), starts),
+            np.add.reduceat(buckets[SUM_SQ].to_numpy(np.float64), starts)
+        )
+    return pd.concat([buckets.loc[starts, by].reset_index(drop=True), metric_frame(stats)], axis=1)
@@ -0,0 +1,63 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+STATS = "mean", "median", "std_dev", "q1", "q3", "count"
+
+
+def sort_groups(codes: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    keep = codes >= 0
+    codes, values = codes[keep].astype(np.int64), values[keep]
+    if np.issubdtype(values.dtype, np.integer) and len(values):
+        # Integer delays are packed next to the group code, so a single value sort orders both
+        low = int(values.min())
+        if int(values.max()) - low < 2 ** 32:
+            packed = np.sort((codes << 32) | (values.astype(np.int64) - low))
+            return packed >> 32, (packed & 0xFFFFFFFF).astype(np.float64) + low
+    order = np.lexsort((values, codes))
+    return codes[order], values[order].astype(np.float64)
+
+
+def segment_starts(sorted_codes: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.diff(sorted_codes, prepend=-1))
+
+
+def moments(n: np.ndarray, total: np.ndarray, total_sq: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = np.where(n > 1, (total_sq - total * total / n) / (n - 1), np.nan)
+        return total / n, np.sqrt(np.clip(variance, 0, None))
+
+
+def segment_stats(values: np.ndarray, starts: np.ndarray, counts: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    if counts is None:
+        n = np.diff(np.append(starts, len(values)))
+        total = np.add.reduceat(values, starts) if len(starts) else values
+        total_sq = np.add.reduceat(values * values, starts) if len(starts) else values
+
+        def at_rank(rank: np.ndarray) -> np.ndarray:
+            return values[starts + rank.astype(np.int64)]
+    else:
+        n = np.add.reduceat(counts, starts) if len(starts) else counts
+        total = np.add.reduceat(values * counts, starts) if len(starts) else values
+        total_sq = np.add.reduceat(values * values * counts, starts) if len(starts) else values
+        cumulative = np.cumsum(counts)
+        offsets = cumulative[starts] - counts[starts]
+
+        def at_rank(rank: np.ndarray) -> np.ndarray:
+            return values[np.searchsorted(cumulative, offsets + rank, side="right")]
+
+    def quantile(q: float) -> np.ndarray:
+        position = q * (n - 1)
+        lower, upper = np.floor(position), np.ceil(position)
+        lower_value, upper_value = at_rank(lower), at_rank(upper)
+        return lower_value + (upper_value - lower_value) * (position - lower)
+
+    mean, std_dev = moments(n, total, total_sq)
+    return {
+        "mean": mean,
+        "median": quantile(0.5),
+        "std_dev": std_dev,
+        "q1": quantile(0.25),
+        "q3": quantile(0.75),
+        "count": n,
+    }
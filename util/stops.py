@@ -0,0 +1,96 @@
+import os
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from util import concat_frames, in_date_range
+from util.instrument import counted, timed
+from util.storage import DAY, iter_traffic, iter_traffic_csv
+
+STOPS_PATH = "data/gtfs/2025/01/03/stops.csv"
+STOP_DELAYS_PATH = "data/traffic/stop-delays.parquet"
+STOP_KEY = "stop_key"
+_COLUMNS = ["Timestamp", "Stop Name", "Type", "Delay"]
+
+
+def load_stops(path: str = STOPS_PATH) -> pd.DataFrame:
+    # Delay records only carry the stop name, so platforms sharing a name and position collapse into one point
+    stops_df = (pd.read_csv(path, usecols=["stop_name", "stop_lat", "stop_lon"])
+                .drop_duplicates()
+                .sort_values(["stop_name", "stop_lat", "stop_lon"], ignore_index=True))
+    stops_df[STOP_KEY] = pd.factorize(stops_df["stop_name"])[0].astype(np.int32)
+    return stops_df
+
+
+def _stop_totals(delays: pd.DataFrame, stops_df: pd.DataFrame) -> pd.DataFrame:
+    names = pd.Index(stops_df["stop_name"].drop_duplicates())
+    stop_names = delays["Stop Name"].astype("category").cat
+    keys = np.append(names.get_indexer(stop_names.categories), -1)
+    delays = delays.assign(**{STOP_KEY: keys[stop_names.codes], DAY: delays["Timestamp"].dt.normalize()})
+    delays = delays[delays[STOP_KEY] >= 0]
+    return (delays
+            .groupby([STOP_KEY, "Type", DAY], observed=True)["Delay"]
+            .agg(count="count", sum="sum")
+            .reset_index())
+
+
+def build_stop_delays(delays_chunks, stops_df: pd.DataFrame) -> pd.DataFrame:
+    totals = concat_frames(_stop_totals(chunk, stops_df) for chunk in counted(delays_chunks))
+    totals = totals.groupby([STOP_KEY, "Type", DAY], observed=True)[["count", "sum"]].sum().reset_index()
+    return stops_df.merge(totals, on=STOP_KEY).sort_values(
+        ["Type", DAY, "stop_name", "stop_lat", "stop_lon"], ignore_index=True
+    )
+
+
+def stop_delays_between(
+        stop_delays: pd.DataFrame,
+        start: Optional[date] = None,
+        end: Optional[date] = None
+) -> pd.DataFrame:
+    # Totals are kept per day, so any date range reduces to summing the days in it
+    in_range = stop_delays[in_date_range(stop_delays[DAY], start, end)]
+    totals = (in_range
+              .groupby(["Type", "stop_name", "stop_lat", "stop_lon"], observed=True)[["count", "sum"]]
+              .sum()
+              .reset_index())
+    totals["Delay"] = totals["sum"] / totals["count"]
+    return totals.drop(columns="sum")
+
+
+@timed("write_stop_delays")
+def write_stop_delays(path: str = STOP_DELAYS_PATH) -> None:
+    chunks = iter_traffic(columns=_COLUMNS)
+    build_stop_delays(chunks, load_stops()).to_parquet(path, index=False, compression="zstd")
+
+
+@timed("update_stop_delays")
+def update_stop_delays(offset: int, path: str = STOP_DELAYS_PATH) -> None:
+    # Totals are per day and add up, only the days that got rows are summed with the appended rows' totals
+    if offset == 0 or not os.path.exists(path):
+        write_stop_delays(path)
+        return
+    added = build_stop_delays(iter_traffic_csv(offset, _COLUMNS), load_stops())
+    if added.empty:
+        return
+    stop_delays = pd.read_parquet(path)
+    affected = stop_delays[DAY].isin(added[DAY].unique())
+    keys = [column for column in stop_delays.columns if column not in ("count", "sum")]
+    totals = (concat_frames([stop_delays[affected], added])
+              .groupby(keys, observed=True)[["count", "sum"]]
+              .sum()
+              .reset_index())
+    concat_frames([stop_delays[~affected], totals]).sort_values(
+        ["Type", DAY, "stop_name", "stop_lat", "stop_lon"], ignore_index=True
+    ).to_parquet(path, index=False, compression="zstd")
+
+
+def load_stop_delays(path: str = STOP_DELAYS_PATH) -> pd.DataFrame:
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    return build_stop_delays(iter_traffic(columns=_COLUMNS), load_stops())
+
+
+def heat_points(stop_delays: pd.DataFrame) -> list:
+    return stop_delays[["stop_lat", "stop_lon", "Delay"]].to_numpy(np.float64).tolist()
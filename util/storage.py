@@ -0,0 +1,296 @@
+import os
+import shutil
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from util.instrument import count, counted, timed
+from util.schema import TRAFFIC_DTYPES, WEATHER_DTYPES, TrafficColumn, Type
+
+TRAFFIC_CSV = "data/traffic/delays-merged.csv"
+TRAFFIC_STORE = "data/traffic/delays-merged"
+WEATHER_CSV = "data/weather/weather-merged.csv"
+WEATHER_STORE = "data/weather/weather-merged.parquet"
+# Uncompressed Arrow files every process maps read-only, see util.serving
+TRAFFIC_MAPPED = "data/traffic/delays-merged.arrow"
+WEATHER_MAPPED = "data/weather/weather-merged.arrow"
+MAPPED = os.getenv("PAD_MAPPED", "1") != "0"
+
+DAY = "day"
+CHUNK_SIZE = 2_000_000
+
+Filters = List[Tuple[str, str, Any]]
+
+_ARROW_TYPES = {
+    Type.STRING: pa.string(),
+    Type.DOUBLE: pa.float64(),
+    Type.BOOL: pa.bool_(),
+    Type.CATEGORY: pa.dictionary(pa.int32(), pa.string()),
+    Type.INT16: pa.int16(),
+    Type.INT32: pa.int32(),
+    Type.DATETIME: pa.timestamp("ns"),
+}
+TRAFFIC_SCHEMA = pa.schema([(column, _ARROW_TYPES[dtype]) for column, dtype in TRAFFIC_DTYPES.items()])
+WEATHER_MEASUREMENTS = [column for column, dtype in WEATHER_DTYPES.items() if dtype == Type.DOUBLE]
+_PARTITIONING = ds.partitioning(pa.schema([(DAY, pa.string())]), flavor="hive")
+
+
+def _csv_options(dtypes: Dict[str, Type], columns: Optional[List[str]] = None) -> dict:
+    # Integers are parsed wide and narrowed after a range check, read_csv silently wraps on overflow
+    columns = columns or list(dtypes)
+    return {
+        "dtype": {
+            column: "int64" if dtype in (Type.INT16, Type.INT32) else dtype.value
+            for column, dtype in dtypes.items() if column in columns and dtype != Type.DATETIME
+        },
+        "parse_dates": [column for column in columns if dtypes.get(column) == Type.DATETIME],
+    }
+
+
+def traffic_types(df: pd.DataFrame) -> pd.DataFrame:
+    for column, dtype in TRAFFIC_DTYPES.items():
+        if column not in df:
+            continue
+        if dtype == Type.DATETIME:
+            df[column] = pd.to_datetime(df[column])
+        elif dtype in (Type.INT16, Type.INT32):
+            info = np.iinfo(dtype.value)
+            if df[column].min() < info.min or df[column].max() > info.max:
+                raise ValueError(f"{column} doesn't fit in {dtype.value}")
+            df[column] = df[column].astype(dtype.value)
+        else:
+            df[column] = df[column].astype(dtype.value)
+    return df
+
+
+def _filter_mask(df: pd.DataFrame, filters: Filters) -> pd.Series:
+    ops = {
+        "==": lambda col, value: col == value,
+        "!=": lambda col, value: col != value,
+        "<": lambda col, value: col < value,
+        "<=": lambda col, value: col <= value,
+        ">": lambda col, value: col > value,
+        ">=": lambda col, value: col >= value,
+        "in": lambda col, value: col.isin(value),
+        "not in": lambda col, value: ~col.isin(value),
+    }
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        mask &= ops[op](df[column], value)
+    return mask
+
+
+def _partition_filters(filters: Filters) -> Filters:
+    # Timestamp bounds are mirrored onto the day partitions, so days outside them are never opened
+    ops = {">": ">=", ">=": ">=", "<": "<=", "<=": "<=", "==": "=="}
+    day_filters = []
+    for column, op, value in filters:
+        if column != TrafficColumn.TIMESTAMP.value or op not in ops:
+            continue
+        value = pd.Timestamp(value)
+        exclusive_midnight = op == "<" and value == value.normalize()
+        day_filters.append((DAY, "<" if exclusive_midnight else ops[op], value.strftime("%Y-%m-%d")))
+    return filters + day_filters
+
+
+def path_mtime(*paths: str) -> float:
+    return max((os.path.getmtime(path) for path in paths if os.path.exists(path)), default=0.0)
+
+
+def traffic_mtime() -> float:
+    return path_mtime(TRAFFIC_STORE, TRAFFIC_CSV)
+
+
+def weather_mtime() -> float:
+    return path_mtime(WEATHER_STORE, WEATHER_CSV)
+
+
+def write_mapped(path: str, chunks: Iterable[pd.DataFrame]) -> None:
+    # Chunks are written as they come, one record batch each. A category column keeps a single dictionary in the
+    # file: new values of a chunk are appended after the known ones and only the added part is written as a delta
+    categories: Dict[str, pd.Index] = {}
+    schema = writer = None
+    with pa.OSFile(f"{path}.part", "wb") as sink:
+        for chunk in chunks:
+            for column in chunk.select_dtypes("category"):
+                known = categories.get(column, pd.Index([], dtype=object))
+                categories[column] = known.append(chunk[column].cat.categories.difference(known))
+            chunk = chunk.assign(**{
+                column: chunk[column].cat.set_categories(values) for column, values in categories.items()
+            })
+            if writer is None:
+                # Dictionary indices are fixed at int32, pandas narrows codes to the number of categories
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                for column in categories:
+                    i = schema.get_field_index(column)
+                    schema = schema.set(i, schema.field(i).with_type(pa.dictionary(pa.int32(), pa.string())))
+                writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        os.remove(f"{path}.part")
+        return
+    os.replace(f"{path}.part", path)
+
+
+def mapped_table(path: str, source_mtime: float) -> Optional[pa.Table]:
+    # Pages come from the OS page cache and are shared by every process mapping the file, nothing is copied
+    if not MAPPED or not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+        return None
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def mapped_frame(table: pa.Table) -> pd.DataFrame:
+    # One block per column keeps numeric, timestamp and category code columns as views of the mapping, as long as
+    # the table is a single record batch, e.g. the cube or weather; traffic batches are joined into one copy
+    return table.to_pandas(split_blocks=True)
+
+
+def _filter_table(table: pa.Table, columns: Optional[List[str]], filters: Optional[Filters]) -> pa.Table:
+    if filters:
+        return ds.dataset(table).to_table(columns=columns, filter=pq.filters_to_expression(filters))
+    return table.select(columns) if columns else table
+
+
+def iter_traffic_csv(
+        offset: int = 0,
+        columns: Optional[List[str]] = None,
+        csv_path: str = TRAFFIC_CSV,
+        chunk_size: int = CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    # Rows from a byte offset on, an incremental merge appends its rows at the end and returns where they start
+    if offset and offset >= os.path.getsize(csv_path):
+        return
+    header = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    with open(csv_path, "rb") as file:
+        file.seek(offset)
+        if offset == 0:
+            file.readline()
+        for chunk in pd.read_csv(
+                file, header=None, names=header, usecols=columns, chunksize=chunk_size,
+                **_csv_options(TRAFFIC_DTYPES, columns)
+        ):
+            yield traffic_types(chunk[columns] if columns else chunk)
+
+
+@timed("write_traffic_store")
+def write_traffic_store(csv_path: str = TRAFFIC_CSV, store_path: str = TRAFFIC_STORE, offset: int = 0) -> List[str]:
+    # From offset 0 the store is rebuilt, otherwise the appended rows are added as new files of their days
+    if offset == 0:
+        shutil.rmtree(store_path, ignore_errors=True)
+    schema = TRAFFIC_SCHEMA.append(pa.field(DAY, pa.string()))
+    days = set()
+    for i, chunk in enumerate(counted(iter_traffic_csv(offset, csv_path=csv_path))):
+        chunk[DAY] = chunk["Timestamp"].dt.strftime("%Y-%m-%d")
+        days.update(chunk[DAY].unique())
+        ds.write_dataset(
+            pa.Table.from_pandas(chunk, schema=schema, preserve_index=False),
+            store_path,
+            format="parquet",
+            partitioning=_PARTITIONING,
+            basename_template=f"part-{offset:012d}-{i:05d}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        )
+    if os.path.isdir(store_path):
+        # Files added to existing days don't touch the store directory itself, its mtime marks the update
+        os.utime(store_path)
+    return sorted(days)
+
+
+def _weather_types(df: pd.DataFrame) -> pd.DataFrame:
+    for column, dtype in WEATHER_DTYPES.items():
+        if column in df:
+            df[column] = pd.to_datetime(df[column]) if dtype == Type.DATETIME else df[column].astype(dtype.value)
+    return df
+
+
+@timed("write_weather_store")
+def write_weather_store(csv_path: str = WEATHER_CSV, store_path: str = WEATHER_STORE) -> None:
+    weather_df = _weather_types(pd.read_csv(csv_path, **_csv_options(WEATHER_DTYPES)))
+    count(len(weather_df))
+    weather_df.to_parquet(store_path, index=False, compression="zstd")
+
+
+@timed("read_traffic")
+def read_traffic(columns: Optional[List[str]] = None, filters: Optional[Filters] = None) -> pd.DataFrame:
+    mapped = mapped_table(TRAFFIC_MAPPED, traffic_mtime())
+    if mapped is not None:
+        traffic_df = mapped_frame(_filter_table(mapped, columns, filters))
+        count(len(traffic_df))
+        return traffic_df
+    if os.path.isdir(TRAFFIC_STORE):
+        dataset = ds.dataset(TRAFFIC_STORE, format="parquet", partitioning=_PARTITIONING)
+        columns = columns or TRAFFIC_SCHEMA.names
+        expression = pq.filters_to_expression(_partition_filters(filters)) if filters else None
+        traffic_df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        count(len(traffic_df))
+        return traffic_df
+    traffic_df = pd.read_csv(TRAFFIC_CSV, usecols=columns, **_csv_options(TRAFFIC_DTYPES, columns))
+    traffic_df = traffic_types(traffic_df[columns] if columns else traffic_df)
+    if filters:
+        traffic_df = traffic_df[_filter_mask(traffic_df, filters)].reset_index(drop=True)
+    count(len(traffic_df))
+    return traffic_df
+
+
+def iter_traffic(
+        columns: Optional[List[str]] = None,
+        filters: Optional[Filters] = None,
+        chunk_size: int = CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    mapped = mapped_table(TRAFFIC_MAPPED, traffic_mtime())
+    if mapped is not None:
+        for batch in _filter_table(mapped, columns, filters).to_batches(max_chunksize=chunk_size):
+            yield mapped_frame(pa.Table.from_batches([batch]))
+        return
+    if os.path.isdir(TRAFFIC_STORE):
+        dataset = ds.dataset(TRAFFIC_STORE, format="parquet", partitioning=_PARTITIONING)
+        expression = pq.filters_to_expression(_partition_filters(filters)) if filters else None
+        for batch in dataset.to_batches(columns=columns or TRAFFIC_SCHEMA.names, filter=expression, batch_size=chunk_size):
+            yield batch.to_pandas()
+        return
+    for chunk in pd.read_csv(
+            TRAFFIC_CSV, usecols=columns, chunksize=chunk_size, **_csv_options(TRAFFIC_DTYPES, columns)
+    ):
+        chunk = traffic_types(chunk[columns] if columns else chunk)
+        yield chunk[_filter_mask(chunk, filters)] if filters else chunk
+
+
+def traffic_days() -> List[str]:
+    if os.path.isdir(TRAFFIC_STORE):
+        return sorted(name.split("=", 1)[1] for name in os.listdir(TRAFFIC_STORE) if name.startswith(f"{DAY}="))
+    timestamp = TrafficColumn.TIMESTAMP.value
+    timestamps = pd.read_csv(TRAFFIC_CSV, usecols=[timestamp], parse_dates=[timestamp])[timestamp]
+    return sorted(timestamps.dt.strftime("%Y-%m-%d").unique())
+
+
+def weather_columns() -> List[str]:
+    if os.path.exists(WEATHER_STORE):
+        return pq.read_schema(WEATHER_STORE).names
+    return pd.read_csv(WEATHER_CSV, nrows=0).columns.tolist()
+
+
+@timed("read_weather")
+def read_weather(columns: Optional[List[str]] = None, filters: Optional[Filters] = None) -> pd.DataFrame:
+    mapped = mapped_table(WEATHER_MAPPED, weather_mtime())
+    if mapped is not None:
+        weather_df = mapped_frame(_filter_table(mapped, columns, filters))
+        count(len(weather_df))
+        return weather_df
+    if os.path.exists(WEATHER_STORE):
+        weather_df = pd.read_parquet(WEATHER_STORE, columns=columns, filters=filters)
+        count(len(weather_df))
+        return weather_df
+    weather_df = pd.read_csv(WEATHER_CSV, usecols=columns, **_csv_options(WEATHER_DTYPES, columns))
+    weather_df = _weather_types(weather_df[columns] if columns else weather_df)
+    if filters:
+        weather_df = weather_df[_filter_mask(weather_df, filters)].reset_index(drop=True)
+    count(len(weather_df))
+    return weather_df